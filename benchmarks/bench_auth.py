@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------
+# Micro-benchmark of logged out detection on large /profile
+# responses: the old 'Password' in response.text scan against
+# edapi_transport.authState().
+# ----------------------------------------------------------------
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # NOQA
+from edapi_transport import authState  # NOQA
+
+
+def parse_args():
+    '''
+    Parse arguments.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Benchmark logged out detection.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--commodities",
+                        type=int,
+                        default=5000,
+                        help="Number of commodities in the fake profile.")
+    parser.add_argument("--number",
+                        type=int,
+                        default=20,
+                        help="Timing loops per check.")
+    return parser.parse_args()
+
+
+def fakeResponse(body, contentType, url):
+    '''
+    Build a requests Response as the API would return it.
+    '''
+    response = requests.models.Response()
+    response.status_code = 200
+    response.url = url
+    response._content = body
+    if contentType:
+        response.headers['Content-Type'] = contentType
+    return response
+
+
+def fakeProfile(count):
+    commodities = [
+        {
+            'name': 'Commodity {}'.format(i),
+            'categoryname': 'Category {}'.format(i % 15),
+            'buyPrice': 1000 + i,
+            'sellPrice': 990 + i,
+            'stock': 5000,
+            'stockBracket': 2,
+            'demand': 0,
+            'demandBracket': 0,
+        }
+        for i in range(count)
+    ]
+    return {
+        'commander': {'name': 'Bench', 'docked': True},
+        'lastSystem': {'name': 'Eranin'},
+        'lastStarport': {'name': 'Azeban City', 'commodities': commodities},
+    }
+
+
+def oldCheck(response):
+    # What _getURI used to do on every request.
+    return (
+        'Password' in str(response.text) or
+        'Password' in str(response.text)
+    )
+
+
+def Main():
+    args = parse_args()
+    body = json.dumps(fakeProfile(args.commodities)).encode('utf-8')
+    url = 'https://companion.orerve.net/profile'
+    cases = (
+        ('json, typed', fakeResponse(body, 'application/json', url)),
+        ('json, untyped', fakeResponse(body, None, url)),
+        ('html login', fakeResponse(
+            b'<html>' + b' ' * 20000 + b'Password</html>',
+            'text/html; charset=utf-8',
+            'https://companion.orerve.net/user/login',
+        )),
+    )
+
+    print('Profile body: {:,} bytes'.format(len(body)))
+    print('{:<16} {:>12} {:>12} {:>8}'.format(
+        'Response', 'text scan', 'authState', 'speedup'
+    ))
+    for name, response in cases:
+        old = timeit.timeit(
+            lambda: oldCheck(response), number=args.number
+        ) / args.number
+        new = timeit.timeit(
+            lambda: authState(response), number=args.number
+        ) / args.number
+        print('{:<16} {:>10.3f}ms {:>10.4f}ms {:>7.0f}x'.format(
+            name, old * 1000, new * 1000, old / new if new else 0
+        ))
+
+
+if __name__ == "__main__":
+    sys.exit(Main())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------
+# Benchmark of the --export formats: size on disk, time to write a
+# batch of station exports and time to read them all back, as an
+# analytics job loading many exports would.
+# ----------------------------------------------------------------
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # NOQA
+import edapi_export  # NOQA
+from edapi_names import NameTable  # NOQA
+
+
+def parse_args():
+    '''
+    Parse arguments.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Benchmark the export formats.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--stations",
+                        type=int,
+                        default=500,
+                        help="Number of station exports to write and read.")
+    parser.add_argument("--commodities",
+                        type=int,
+                        default=100,
+                        help="Commodities per market.")
+    parser.add_argument("--ships",
+                        type=int,
+                        default=20,
+                        help="Ships per shipyard.")
+    parser.add_argument("--modules",
+                        type=int,
+                        default=300,
+                        help="Modules per outfitting.")
+    return parser.parse_args()
+
+
+def fakeProfile(i, args, rng):
+    '''
+    A docked profile with a market, shipyard and outfitting.
+    '''
+    return {
+        'commander': {'name': 'CMDR {}'.format(i), 'docked': True},
+        'lastSystem': {'name': 'System {}'.format(i)},
+        'lastStarport': {
+            'name': 'Station {}'.format(i),
+            'commodities': [
+                {
+                    'name': 'Commodity {}'.format(n),
+                    'categoryname': 'Category {}'.format(n % 15),
+                    'buyPrice': rng.randint(0, 10000),
+                    'sellPrice': rng.randint(1, 10000),
+                    'stock': rng.randint(0, 50000),
+                    'stockBracket': rng.randint(0, 3),
+                    'demand': rng.randint(0, 50000),
+                    'demandBracket': rng.randint(0, 3),
+                }
+                for n in range(args.commodities)
+            ],
+            'ships': {
+                'shipyard_list': {
+                    'Ship {}'.format(n): {} for n in range(args.ships)
+                },
+                'unavailable_list': [{'name': 'Ship X'}],
+            },
+            'modules': {
+                str(128049250 + n): {} for n in range(args.modules)
+            },
+        },
+    }
+
+
+def writeJSON(path, profile):
+    # What --export writes.
+    with open(path, 'w') as outfile:
+        json.dump(profile, outfile, indent=4, sort_keys=True)
+    return [path]
+
+
+def readJSON(path):
+    with open(path) as h:
+        return json.load(h)
+
+
+def size(paths):
+    return sum(os.path.getsize(p) for p in paths)
+
+
+def Main():
+    args = parse_args()
+    rng = random.Random(1)
+    names = NameTable()
+    modules = {
+        128049250 + n: {
+            'category': 'standard',
+            'class': str(n % 8),
+            'name': 'Module {}'.format(n),
+            'rating': 'ABCDE'[n % 5],
+            'ship': 'Ship {}'.format(n % 20),
+        }
+        for n in range(args.modules)
+    }
+    profiles = [fakeProfile(i, args, rng) for i in range(args.stations)]
+    tables = [
+        edapi_export.exportTables(p, names, {}, modules) for p in profiles
+    ]
+
+    formats = [('json', writeJSON, readJSON, profiles)]
+    for fmt in edapi_export.FORMATS[1:]:
+        if edapi_export.missing(fmt):
+            print('Skipping {}: {}'.format(fmt, edapi_export.missing(fmt)))
+            continue
+        formats.append((
+            fmt,
+            edapi_export.writers[fmt],
+            edapi_export.readers[fmt],
+            tables,
+        ))
+
+    print('{} stations, {} commodities, {} ships, {} modules each'.format(
+        args.stations, args.commodities, args.ships, args.modules
+    ))
+    if edapi_export.pyarrow is None:
+        print('pyarrow not installed: columnar is the packed layout.')
+    print('{:<10} {:>12} {:>10} {:>10}'.format(
+        'Format', 'Bytes', 'Write', 'Read'
+    ))
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt, writer, reader, data in formats:
+            paths = []
+            files = []
+            start = time.perf_counter()
+            for i, item in enumerate(data):
+                path = os.path.join(tmp, '{}-{}.{}'.format(fmt, i, fmt))
+                files.extend(writer(path, item))
+                paths.append(path)
+            write = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for path in paths:
+                reader(path)
+            read = time.perf_counter() - start
+
+            print('{:<10} {:>12,} {:>8.0f}ms {:>8.0f}ms'.format(
+                fmt,
+                size(files),
+                write * 1000,
+                read * 1000,
+            ))
+
+
+if __name__ == "__main__":
+    sys.exit(Main())
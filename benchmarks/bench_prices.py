@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------
+# Benchmark of .prices files with a category header before every
+# commodity against ones grouped by category: size, lines, time to
+# write and time for TD to parse.
+#
+# With --tdpath the markets use TD's own stations and items, and are
+# parsed by TD's cache.processPricesFile() into a scratch copy of its
+# database. Without TD, made up markets are parsed by a line parser
+# modelled on it.
+# ----------------------------------------------------------------
+
+import argparse
+import io
+import os
+import pathlib
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # NOQA
+from edapi_market import groupLines, normalizeMarket  # NOQA
+from edapi_names import NameTable  # NOQA
+from edapi_td import itemOrder  # NOQA
+
+
+def parse_args():
+    '''
+    Parse arguments.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Benchmark grouped .prices output.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--tdpath",
+                        default=None,
+                        help="Path to the Trade Dangerous root. Parse with TD\
+                        itself instead of the model parser.")
+    parser.add_argument("--stations",
+                        type=int,
+                        default=200,
+                        help="Number of markets in the file, as in a batch\
+                        or replay import.")
+    parser.add_argument("--commodities",
+                        type=int,
+                        default=100,
+                        help="Commodities per market.")
+    parser.add_argument("--categories",
+                        type=int,
+                        default=15,
+                        help="Categories the commodities are spread over.")
+    parser.add_argument("--number",
+                        type=int,
+                        default=10,
+                        help="Timing loops per check.")
+    return parser.parse_args()
+
+
+def fakeCommodities(count, categories, rng):
+    '''
+    A market in API order, which mixes the categories.
+    '''
+    commodities = [
+        {
+            'name': 'Commodity {}'.format(i),
+            'categoryname': 'Category {}'.format(i % categories),
+            'buyPrice': rng.randint(0, 10000),
+            'sellPrice': rng.randint(1, 10000),
+            'stock': rng.choice((0, rng.randint(1, 50000))),
+            'stockBracket': rng.randint(0, 3),
+            'demand': rng.choice((0, rng.randint(1, 50000))),
+            'demandBracket': rng.randint(0, 3),
+        }
+        for i in range(count)
+    ]
+    rng.shuffle(commodities)
+    return commodities
+
+
+def loadTD(tdpath):
+    '''
+    TD's cache module, a TradeEnv and a scratch copy of its database, or
+    None if TD can't be found at tdpath.
+    '''
+    sys.path.insert(0, tdpath)
+    try:
+        import cache
+        import tradeenv
+    except ImportError:
+        return None
+
+    tdenv = tradeenv.TradeEnv()
+    tdenv.dataDir = os.path.join(tdpath, 'data')
+    source = os.path.join(tdenv.dataDir, 'TradeDangerous.db')
+    if not os.path.exists(source):
+        return None
+
+    # The import writes StationItem rows. Leave the real ones alone.
+    scratch = os.path.join(tempfile.mkdtemp(), 'TradeDangerous.db')
+    shutil.copyfile(source, scratch)
+    return cache, tdenv, sqlite3.connect(scratch)
+
+
+def tdMarkets(db, count, stations, rng):
+    '''
+    Markets of up to count of TD's items, in API form, at the first
+    stations in TD, as (place, commodities).
+    '''
+    items = db.execute(
+        """
+        SELECT c.name, i.name
+        FROM Item i JOIN Category c ON c.category_id = i.category_id
+        """
+    ).fetchall()
+    places = db.execute(
+        """
+        SELECT sy.name, st.name
+        FROM Station st JOIN System sy ON sy.system_id = st.system_id
+        ORDER BY st.station_id
+        LIMIT ?
+        """,
+        (stations,),
+    ).fetchall()
+
+    markets = []
+    for system, station in places:
+        commodities = fakeCommodities(count, 1, rng)
+        for c, (category, name) in zip(
+            commodities,
+            rng.sample(items, min(count, len(items))),
+        ):
+            c['categoryname'] = category
+            c['name'] = name
+        markets.append(('{}/{}'.format(system, station), commodities))
+    return markets
+
+
+def tdParser(cache, tdenv, db):
+    '''
+    A parse(text) running TD's own .prices import on text.
+    '''
+    fd, fname = tempfile.mkstemp(suffix='.prices')
+    os.close(fd)
+    path = pathlib.Path(fname)
+
+    def parse(text):
+        path.write_text(text, encoding='utf-8')
+        cache.processPricesFile(tdenv, db, path)
+
+    return parse
+
+
+def writeEvery(f, place, market):
+    # The writer before grouping.
+    f.write("@ {}\n".format(place))
+    for c in market:
+        f.write("\t+ {}\n".format(c.category))
+        f.write(c.tdLine())
+
+
+def writeGrouped(f, place, market, order):
+    f.write("@ {}\n".format(place))
+    for category, lines in groupLines(market, order=order):
+        f.write("\t+ {}\n".format(category))
+        f.writelines(lines)
+
+
+itemRe = re.compile(
+    r'^(?P<item>.*?)\s+(?P<sell>\d+)\s+(?P<buy>\d+)'
+    r'\s+(?P<demand>\?|-|\d+[LMH?])\s+(?P<supply>\?|-|\d+[LMH?])'
+    r'(?:\s+(?P<time>\S+ \S+))?$'
+)
+
+
+def parsePrices(text, categories, items):
+    '''
+    The per line work of TD's importer: station and category headers are
+    looked up, item lines matched and their item resolved.
+    '''
+    rows = 0
+    place = category = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('@'):
+            place = line[1:].strip().upper()
+            continue
+        if line.startswith('+'):
+            category = categories[line[1:].strip().upper()]
+            continue
+        match = itemRe.match(line)
+        items[match.group('item').upper()]
+        rows += 1
+    return place, category, rows
+
+
+def Main():
+    args = parse_args()
+    rng = random.Random(1)
+    names = NameTable()
+
+    td = args.tdpath and loadTD(args.tdpath)
+    if td:
+        cache, tdenv, db = td
+        raw = tdMarkets(db, args.commodities, args.stations, rng)
+        order = itemOrder(db)
+        parse = tdParser(cache, tdenv, db)
+        parser = "TD's processPricesFile()"
+    else:
+        if args.tdpath:
+            print("Can't find Trade Dangerous. Using the model parser.")
+        raw = [
+            (
+                'System {}/Station {}'.format(i, i),
+                fakeCommodities(args.commodities, args.categories, rng),
+            )
+            for i in range(args.stations)
+        ]
+        order = {
+            'COMMODITY {}'.format(i).upper(): i
+            for i in range(args.commodities)
+        }
+        categories = {
+            'CATEGORY {}'.format(i).upper(): i
+            for i in range(args.categories)
+        }
+
+        def parse(text):
+            parsePrices(text, categories, order)
+
+        parser = 'the model parser'
+
+    markets = [
+        (place, normalizeMarket(commodities, names))
+        for place, commodities in raw
+    ]
+
+    def every():
+        f = io.StringIO()
+        for place, market in markets:
+            writeEvery(f, place, market)
+        return f.getvalue()
+
+    def grouped():
+        f = io.StringIO()
+        for place, market in markets:
+            writeGrouped(f, place, market, order)
+        return f.getvalue()
+
+    print('{} markets of {} commodities, parsed by {}'.format(
+        len(markets), args.commodities, parser
+    ))
+    print('{:<16} {:>10} {:>8} {:>10} {:>10}'.format(
+        'Writer', 'Bytes', 'Lines', 'Write', 'Parse'
+    ))
+    for name, writer in (('header per line', every), ('grouped', grouped)):
+        text = writer()
+        write = timeit.timeit(writer, number=args.number) / args.number
+        parseTime = timeit.timeit(
+            lambda: parse(text),
+            number=args.number,
+        ) / args.number
+        print('{:<16} {:>10,} {:>8,} {:>8.1f}ms {:>8.1f}ms'.format(
+            name,
+            len(text.encode('utf-8')),
+            text.count('\n'),
+            write * 1000,
+            parseTime * 1000,
+        ))
+
+
+if __name__ == "__main__":
+    sys.exit(Main())
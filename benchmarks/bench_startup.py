@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------
+# Benchmark of start up cost: a bare interpreter, loading edapi.py,
+# importing the Trade Dangerous modules and opening the TD database,
+# each in a fresh process. The difference between the last two and
+# the first two is what --no-td saves.
+# ----------------------------------------------------------------
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+EDAPI = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'edapi.py',
+)
+
+
+def parse_args():
+    '''
+    Parse arguments.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Benchmark start up with and without Trade Dangerous.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--tdpath",
+                        default=".",
+                        help="Path to the Trade Dangerous root.")
+    parser.add_argument("--number",
+                        type=int,
+                        default=10,
+                        help="Processes started per check.")
+    return parser.parse_args()
+
+
+def checks(tdpath):
+    tdpath = os.path.abspath(tdpath)
+    modules = (
+        'import sys; sys.path.insert(0, {!r}); '
+        'import tradeenv, tradedb, cache, csvexport; '
+    ).format(tdpath)
+    database = modules + (
+        'tdenv = tradeenv.TradeEnv(); '
+        'tdenv.dataDir = {!r}; '
+        'tradedb.TradeDB(tdenv)'
+    ).format(os.path.join(tdpath, 'data'))
+    return (
+        ('python', ['-c', 'pass']),
+        ('edapi.py', [EDAPI, '--version']),
+        ('TD modules', ['-c', modules]),
+        ('TD database', ['-c', database]),
+    )
+
+
+def run(argv, number):
+    '''
+    Median wall time of starting a process, in seconds.
+    '''
+    times = []
+    for _ in range(number):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable] + argv,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def Main():
+    args = parse_args()
+    print('{:<12} {:>10}'.format('Check', 'Median'))
+    for name, argv in checks(args.tdpath):
+        try:
+            median = run(argv, args.number)
+        except subprocess.CalledProcessError:
+            print('{:<12} {:>10}'.format(name, 'failed'))
+            continue
+        print('{:<12} {:>8.0f}ms'.format(name, median * 1000))
+
+
+if __name__ == "__main__":
+    sys.exit(Main())
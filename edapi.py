@@ -4,23 +4,36 @@
 # ----------------------------------------------------------------
 
 import argparse
+import atexit
+import concurrent.futures
 import getpass
 import json
 import os
-from pathlib import Path
 import platform
-import pickle
 from pprint import pprint
 import requests
 from requests.utils import dict_from_cookiejar
-from requests.utils import cookiejar_from_dict
 import sys
-import tempfile
 import textwrap
 import time
 import traceback
 
 import eddn
+from edapi_archive import ProfileArchive
+from edapi_csv import CSVExporter
+from edapi_market import td_levels
+from edapi_names import NameTable
+from edapi_stations import defaultProviders, resolveStation
+from edapi_stats import RequestStats
+from edapi_pipeline import ChangeSink, CSVSink, EDDNSink, HistorySink  # NOQA
+from edapi_pipeline import JSONSink, Pipeline, SnapshotSink
+from edapi_pipeline import newestSource, placeOf
+from edapi_td import PricesTextSink, StationItemSink, syncShipVendor
+from edapi_td import databasePath, ensureLoaded, shipIDs
+from edapi_store import CookieStore, PriceSnapshots, ProfileCache
+from edapi_store import StationIndex, StationRow
+from edapi_transport import AUTH_CONFIRM, AUTH_LOGIN, AUTH_OK, authState
+from edapi_transport import Transport, TransportConfig
 
 __version_info__ = ('3', '6', '1')
 __version__ = '.'.join(__version_info__)
@@ -29,55 +42,18 @@ __version__ = '.'.join(__version_info__)
 # Deal with some differences in names between TD, ED and the API.
 # ----------------------------------------------------------------
 
-# Categories to ignore. Drones end up here. No idea what they are.
-cat_ignore = [
-    'NonMarketable',
-]
+# Category and commodity fixes, shared with the TD plugin. Edit
+# edapi_names.json to change them.
+name_table = NameTable()
 
-# TD has different names for these.
-cat_correct = {
-    'Narcotics': 'Legal Drugs',
-    'Slaves': 'Slavery',
-}
-
-# Commodities to ignore. Don't try to pass these to TD. This is mostly for
-# rares.
-comm_ignore = (
-    'Alien Eggs',
-    'Lavian Brandy',
-)
-
-# TD has different names for these.
-comm_correct = {
-    'Agricultural Medicines': 'Agri-Medicines',
-    'Atmospheric Extractors': 'Atmospheric Processors',
-    'Auto Fabricators': 'Auto-Fabricators',
-    'Basic Narcotics': 'Narcotics',
-    'Bio Reducing Lichen': 'Bioreducing Lichen',
-    'Hafnium178': 'Hafnium 178',
-    'Hazardous Environment Suits': 'H.E. Suits',
-    'Heliostatic Furnaces': 'Microbial Furnaces',
-    'Marine Supplies': 'Marine Equipment',
-    'Meta Alloys': 'Meta-Alloys',
-    'Non Lethal Weapons': 'Non-Lethal Weapons',
-    'S A P8 Core Container': 'SAP 8 Core Container',
-    'Skimer Components': 'Skimmer Components',
-    'Terrain Enrichment Systems': 'Land Enrichment Systems',
-    'U S S Cargo Ancient Artefact': 'Ancient Artefact',
-    'U S S Cargo Experimental Chemicals': 'Experimental Chemicals',
-    'U S S Cargo Military Plans': 'Military Plans',
-    'U S S Cargo Prototype Tech': 'Prototype Tech',
-    'U S S Cargo Rebel Transmissions': 'Rebel Transmissions',
-    'U S S Cargo Technical Blueprints': 'Technical Blueprints',
-    'U S S Cargo Trade Data': 'Trade Data',
-}
+# The --export formats, as edapi_export.FORMATS. That module loads
+# pyarrow, numpy and msgpack, so it is only imported to export.
+export_formats = ('json', 'csv', 'msgpack', 'columnar')
 
 # ----------------------------------------------------------------
 # Some lookup tables.
 # ----------------------------------------------------------------
 
-bracket_levels = ('-', 'L', 'M', 'H')
-
 # This translates what the API calls a ship into what TD calls a
 # ship.
 
@@ -3609,6 +3585,23 @@ def parse_args():
                         help="Path to the Trade Dangerous root. This is used to\
                         locate the Trade Dangerous python modules and data/\
                         directory.")
+    parser.add_argument("--station-info",
+                        metavar="FILE",
+                        default=None,
+                        help="JSON file of station details that override TD\
+                        and the profile. Defaults to edapi_stations.json in\
+                        the TD data directory.")
+    parser.add_argument("--ask",
+                        action="store_true",
+                        default=False,
+                        help="Prompt for station details that no other source\
+                        knows, instead of leaving them unknown.")
+    parser.add_argument("--no-td",
+                        action="store_true",
+                        default=False,
+                        help="Don't load Trade Dangerous. Only post to the EDDN\
+                        and write --vars, --csv, --json and --history. Can't\
+                        be used with --replay.")
 
     # colors
     default = (platform.system() == 'Windows')
@@ -3638,6 +3631,13 @@ def parse_args():
                         default=False,
                         help="Write shipyards to the TD ShipVendor.csv.")
 
+    # Text import
+    parser.add_argument("--text-import",
+                        action="store_true",
+                        default=False,
+                        help="Import prices through a .prices file parsed by\
+                        TD instead of writing to the TD database directly.")
+
     # Import from JSON
     parser.add_argument("--import",
                         metavar="FILE",
@@ -3650,7 +3650,42 @@ def parse_args():
     parser.add_argument("--export",
                         metavar="FILE",
                         default=None,
-                        help="Export API response to a file as JSON.")
+                        help="Export API response to a file as JSON, or the\
+                        station's market, shipyard and outfitting in another\
+                        --export-format.")
+    parser.add_argument("--export-format",
+                        choices=export_formats,
+                        default='json',
+                        help="Format of --export. csv and Parquet write a file\
+                        per table next to FILE. columnar is Parquet when\
+                        pyarrow is installed and a packed file otherwise. See\
+                        edapi_export.py to read them back.")
+
+    # Archive
+    parser.add_argument("--archive",
+                        metavar="FILE",
+                        default=None,
+                        help="Append every profile fetched from the API to a\
+                        compressed archive. See edapi_archive.py to list and\
+                        extract snapshots.")
+
+    # Price history
+    parser.add_argument("--history",
+                        metavar="FILE",
+                        default=None,
+                        help="Append every imported market to a price history.\
+                        See edapi_history.py to query it.")
+
+    # Price outputs
+    parser.add_argument("--csv",
+                        metavar="FILE",
+                        default=None,
+                        help="Append every imported commodity to FILE as CSV.")
+    parser.add_argument("--json",
+                        metavar="FILE",
+                        default=None,
+                        help="Append every imported market to FILE as a line\
+                        of JSON.")
 
     # EDDN
     parser.add_argument("--eddn",
@@ -3659,6 +3694,88 @@ def parse_args():
                         help="Post price, shipyards, and outfitting to the \
                         EDDN.")
 
+    # Transport
+    parser.add_argument("--connect-timeout",
+                        type=float,
+                        default=TransportConfig.connectTimeout,
+                        help="Seconds to wait for a connection to the API.")
+    parser.add_argument("--read-timeout",
+                        type=float,
+                        default=TransportConfig.readTimeout,
+                        help="Seconds to wait for the API to respond.")
+    parser.add_argument("--retries",
+                        type=int,
+                        default=TransportConfig.retries,
+                        help="Number of times to retry a request after a\
+                        connection error or server error.")
+    parser.add_argument("--pool-size",
+                        type=int,
+                        default=TransportConfig.poolMaxsize,
+                        help="Maximum number of kept-alive connections to the\
+                        API.")
+
+    # Cookie write-behind
+    parser.add_argument("--lazy-cookies",
+                        action="store_true",
+                        default=False,
+                        help="Only write changed cookies to the cookie file\
+                        when the program exits.")
+
+    # asyncio client
+    parser.add_argument("--async",
+                        dest="use_async",
+                        action="store_true",
+                        default=False,
+                        help="Fetch from the API with the asyncio client. In\
+                        batch mode all sessions share one event loop.\
+                        Requires Python 3.7 or newer.")
+
+    # Profile cache
+    parser.add_argument("--max-age",
+                        type=int,
+                        default=0,
+                        metavar="SECONDS",
+                        help="Reuse the profile fetched by an earlier run if it\
+                        is at most this old. 0 always asks the API. A reused\
+                        profile is not posted to the EDDN or written to\
+                        --history, --csv or --json again.")
+    parser.add_argument("--refresh",
+                        action="store_true",
+                        default=False,
+                        help="Ignore --max-age and fetch a new profile.")
+
+    # Request statistics
+    parser.add_argument("--stats",
+                        metavar="FILE",
+                        nargs="?",
+                        const="-",
+                        default=None,
+                        help="Report API request timings at exit. Prints a\
+                        table, or writes JSON if FILE is given.")
+
+    # Replay
+    parser.add_argument("--replay",
+                        metavar="PATH",
+                        default=None,
+                        help="Import the newest market of every station found\
+                        in a directory of --export JSON files or in an\
+                        --archive file, in one go.")
+
+    # Batch mode
+    parser.add_argument("--batch",
+                        metavar="NAME",
+                        nargs="+",
+                        default=None,
+                        help="Fetch and import the profiles of several\
+                        commanders at once. Each NAME is a cookie file or a\
+                        base name. Cookies should already be valid, as logins\
+                        would prompt concurrently.")
+    parser.add_argument("--workers",
+                        type=int,
+                        default=4,
+                        help="Number of profiles to fetch at the same time in\
+                        batch mode.")
+
     # keys
     parser.add_argument("--keys",
                         action="append",
@@ -3686,6 +3803,18 @@ def parse_args():
     return args
 
 
+def printStats(stats, fname):
+    '''
+    Print the request statistics, or write them to fname as JSON.
+    '''
+    if fname == '-':
+        print()
+        print(stats.report())
+    else:
+        with open(fname, 'w') as outfile:
+            outfile.write(stats.json())
+
+
 def convertSecs(seconds):
     '''
     Convert a number of seconds to a string.
@@ -3757,7 +3886,12 @@ class EDAPI:
         basename='edapi',
         debug=False,
         cookiefile=None,
-        json_file=None
+        json_file=None,
+        transport=None,
+        writeBehind=False,
+        fetch=True,
+        maxAge=0,
+        stats=None
     ):
         '''
         Initialize
@@ -3774,43 +3908,66 @@ class EDAPI:
 
         self.debug = debug
 
+        # A profile reused from the cache, and when it was fetched. The
+        # timestamp of a new profile is None, for "now".
+        self.cached = False
+        self.timestamp = None
+
         # If json_file was given, just load that instead.
         if json_file:
             with open(json_file) as file:
                 self.profile = json.load(file)
                 return
 
+        # Reuse the profile of a recent run if it is fresh enough.
+        self.profileCache = ProfileCache(self._cookiefile)
+        self.profile = None
+        if maxAge:
+            self.profile = self.profileCache.load(maxAge)
+            if self.profile is not None:
+                self.cached = True
+                self.timestamp = self.profileCache.timestamp
+                if self.debug:
+                    print('Using cached profile:', self.profileCache.path)
+                return
+
         # if self.debug:
         #     import http.client
         #     http.client.HTTPConnection.debuglevel = 3
 
         # Setup the HTTP session.
-        self.opener = requests.Session()
-
-        self.opener.headers = {
-            'User-Agent': self._agent
-        }
-
-        # Read/create the cookie jar.
-        if os.path.exists(self._cookiefile):
-            try:
-                with open(self._cookiefile, 'rb') as h:
-                    self.opener.cookies = cookiejar_from_dict(pickle.load(h))
-            except:
-                print('Unable to read cookie file.')
+        self.opener = Transport(
+            self._agent,
+            transport,
+            debug=self.debug,
+            stats=stats
+        )
 
-        else:
-            with open(self._cookiefile, 'wb') as h:
-                pickle.dump(dict_from_cookiejar(self.opener.cookies), h)
+        # Read the cookie jar.
+        self.cookies = CookieStore(self._cookiefile, writeBehind=writeBehind)
+        try:
+            self.opener.cookies = self.cookies.load()
+        except:
+            print('Unable to read cookie file.')
 
         # Grab the commander profile
+        if fetch:
+            self.profile = self.getProfile()
+
+    def getProfile(self):
+        '''
+        Fetch the commander /profile.
+        '''
         response = self._getURI('profile')
         try:
-            self.profile = response.json()
+            profile = response.json()
         except:
             sys.exit('Unable to parse JSON response for /profile!\
                      Try with --debug and report this.')
 
+        self.profileCache.store(profile)
+        return profile
+
     def _getBasicURI(self, uri, values=None):
         '''
         Perform a GET/POST to a URI
@@ -3821,20 +3978,23 @@ class EDAPI:
             if self.debug:
                 print('GET on: ', self._baseurl+uri)
                 print(dict_from_cookiejar(self.opener.cookies))
-            response = self.opener.get(self._baseurl+uri)
+            response = self.opener.get(self._baseurl+uri, label=uri)
         else:
             if self.debug:
                 print('POST on: ', self._baseurl+uri)
                 print(dict_from_cookiejar(self.opener.cookies))
-            response = self.opener.post(self._baseurl+uri, data=values)
+            response = self.opener.post(
+                self._baseurl+uri,
+                data=values,
+                label=uri
+            )
 
         if self.debug:
             print('Final URL:', response.url)
             print(dict_from_cookiejar(self.opener.cookies))
 
-        # Save the cookies.
-        with open(self._cookiefile, 'wb') as h:
-            pickle.dump(dict_from_cookiejar(self.opener.cookies), h)
+        # Save the cookies if they changed.
+        self.cookies.update(self.opener.cookies)
 
         # Return the response object.
         return response
@@ -3848,11 +4008,11 @@ class EDAPI:
         # login then ask again.
         response = self._getBasicURI(uri, values=values)
 
-        if 'Password' in str(response.text):
+        if authState(response) != AUTH_OK:
             self._doLogin()
             response = self._getBasicURI(uri, values=values)
 
-        if 'Password' in str(response.text):
+        if authState(response) != AUTH_OK:
             sys.exit(textwrap.fill(textwrap.dedent("""\
                 Something went terribly wrong. The login credentials
                 appear correct, but we are being denied access. Sometimes the
@@ -3905,11 +4065,12 @@ class EDAPI:
 
         # If we end up being redirected back to login,
         # the login failed.
-        if 'Password' in str(response.text):
+        state = authState(response)
+        if state == AUTH_LOGIN:
             sys.exit('Login failed.')
 
         # Check to see if we need to do the auth token dance.
-        if str(response.url).endswith('user/confirm'):
+        if state == AUTH_CONFIRM:
             print()
             print("A verification code should have been sent to your "
                   "email address.")
@@ -3921,6 +4082,567 @@ class EDAPI:
         # The API is sometimes very slow to update sessions. Wait a bit...
         time.sleep(2)
 
+
+# ----------------------------------------------------------------
+# Trade Dangerous.
+# ----------------------------------------------------------------
+
+
+def loadTD():
+    '''
+    Import the Trade Dangerous modules and open the database.
+    '''
+    print('Initializing Trade Dangerous...')
+    try:
+        import tradeenv
+    except:
+        sys.exit('Can\'t find Trade Dangerous. Do you need --tdpath?')
+    tdenv = tradeenv.TradeEnv()
+    if args.tdpath is not '.':
+        tdenv.dataDir = args.tdpath+'/data'
+    import tradedb
+
+    # Systems and stations are only loaded when TD's own objects are
+    # needed. See ensureLoaded().
+    tdb = tradedb.TradeDB(tdenv, load=False)
+    tdb.reloadCache()
+
+    return tdb, tdenv
+
+
+def openStationIndex(tdb):
+    '''
+    The station index kept next to the TD database, brought up to date.
+    '''
+    index = StationIndex(os.path.join(str(tdb.dataPath), 'edapi.stations'))
+    index.refresh(tdb.getDB(), databasePath(tdb))
+    return index
+
+
+def findStation(tdb, tdenv, index, system, station):
+    '''
+    The StationRow of a station from the index, or TD's own station if only
+    TD's lookup finds it, or None.
+    '''
+    station_lookup = index.lookup(system, station)
+    if station_lookup is None:
+        ensureLoaded(tdb, tdenv)
+        try:
+            station_lookup = tdb.lookupStation(station, system)
+        except:
+            station_lookup = None
+    return station_lookup
+
+
+def updateStation(tdb, tdenv, profile, c, exporter, index):
+    '''
+    Add the docked station to TD, or fill in any unknown details, marking
+    it for export in exporter and updating the station index. Returns the
+    station.
+    '''
+    system = profile['lastSystem']['name']
+    station = profile['lastStarport']['name']
+
+    # Check to see if this system is in the Stations file
+    station_lookup = findStation(tdb, tdenv, index, system, station)
+
+    # Fill in what we can without asking.
+    info = resolveStation(
+        defaultProviders(
+            tdb.dataPath,
+            station_lookup,
+            overrides=args.station_info,
+            ask=args.ask,
+        ),
+        system,
+        station,
+        profile,
+    )
+
+    # The station isn't in the stations file. Add it.
+    if not station_lookup:
+        print(c.WARNING+'WARNING! Station unknown.'+c.ENDC)
+        print('Adding station...')
+        ensureLoaded(tdb, tdenv)
+        system_lookup = tdb.lookupSystem(system)
+        if tdb.addLocalStation(system=system_lookup, name=station, **info):
+            station_lookup = tdb.lookupStation(station, system)
+            exporter.mark("Station", station_lookup.ID)
+            index.refreshStation(tdb.getDB(), station_lookup.ID)
+        station_lookup = tdb.lookupStation(station, system)
+    else:
+        print(c.OKGREEN+'Station found in station file.'+c.ENDC)
+
+        # See if we need to update the info for this station.
+        if any(
+            info[field] != getattr(station_lookup, field)
+            for field in info
+        ):
+            # TD updates its own station objects.
+            if isinstance(station_lookup, StationRow):
+                ensureLoaded(tdb, tdenv)
+                station_lookup = tdb.lookupStation(station, system)
+            if tdb.updateLocalStation(station=station_lookup, **info):
+                exporter.mark("Station", station_lookup.ID)
+                index.refreshStation(tdb.getDB(), station_lookup.ID)
+
+    return station_lookup
+
+
+def updateShipyard(tdb, tdenv, profile, station_lookup, c, exporter):
+    '''
+    Update the ship vendor for the docked station, marking it for export
+    in exporter. Returns the EDDN names of the ships for sale.
+    '''
+    station = profile['lastStarport']['name']
+
+    # If a shipyard exists, update the ship vendor csv
+    ships = shipyardShips(profile)
+    if ships:
+        print(c.OKGREEN+'Found a shipyard at this station.'+c.ENDC)
+
+        if args.ships:
+            known = shipIDs(tdb.getDB())
+            for ship in ships:
+                if ship_names[ship].upper() not in known:
+                    raise LookupError('Unknown ship: ' + ship_names[ship])
+            added, removed = syncShipVendor(
+                tdb.getDB(),
+                station_lookup.ID,
+                [known[ship_names[ship].upper()] for ship in ships],
+            )
+            if added or removed:
+                print(c.OKBLUE+'Updating ShipVendor.csv...'+c.ENDC)
+                tdenv.NOTE(
+                    "Added {} and removed {} ships in {} shipyard.",
+                    len(added),
+                    len(removed),
+                    station,
+                )
+                exporter.mark("ShipVendor", station_lookup.ID)
+            else:
+                tdenv.NOTE("{} shipyard unchanged.", station)
+
+    return [eddn_ship_names[ship] for ship in ships]
+
+
+def shipyardShips(profile):
+    '''
+    The API names of the ships sold at the docked station, if it has a
+    shipyard.
+    '''
+    if 'ships' not in profile['lastStarport']:
+        return []
+    ships = list(
+        profile['lastStarport']['ships']['shipyard_list'].keys()
+    )
+    for ship in profile['lastStarport']['ships']['unavailable_list']:
+        ships.append(ship['name'])
+    return ships
+
+
+def openSnapshots(tdb):
+    '''
+    The price snapshot store kept next to the TD database.
+    '''
+    return PriceSnapshots(
+        os.path.join(str(tdb.dataPath), 'edapi.snapshots'),
+        databasePath(tdb),
+    )
+
+
+def currentPrices(tdb, stationID, snapshots=None):
+    '''
+    The last imported prices of a station as a dict of name to (sell, buy),
+    from the snapshot store when it has the station, otherwise from TD.
+    '''
+    if snapshots is not None:
+        prices = snapshots.prices(stationID)
+        if prices is not None:
+            return prices
+
+    return {n: (s, b) for (n, s, b) in tdb.getDB().execute(
+        """
+        SELECT
+            Item.name,
+            StationItem.demand_price,
+            StationItem.supply_price
+        FROM
+            StationItem,
+            Item
+        WHERE
+            Item.item_id = StationItem.item_id AND
+            StationItem.station_id = ?
+        """,
+        (stationID,)
+    )}
+
+
+def printPriceChanges(changes, c):
+    '''
+    Print the PriceChange rows of a market.
+    '''
+    header = False
+    for commodity, diffSell, diffBuy in changes:
+        if header is False:
+            header = True
+            print("Price fluctuations:")
+            print("{:->25}-+{:->14}---+{:->14}---+".format(
+                'Commodity',
+                'Sell Price',
+                'Buy Price'
+            ))
+        if diffSell < 0:
+            sellColor = c.FAIL
+        elif diffSell > 0:
+            sellColor = c.OKGREEN
+        else:
+            sellColor = c.ENDC
+        if diffBuy > 0:
+            buyColor = c.FAIL
+        elif diffBuy < 0:
+            buyColor = c.OKGREEN
+        else:
+            buyColor = c.ENDC
+        if args.nocolor:
+            s = "{:>25} | {:>5}{:<8} {} | {:>5}{:<8} {} |"
+        else:
+            s = "{:>25} | {:>5}{:<18} {} | {:>5}{:<18} {} |"
+        print(s.format(
+            commodity.name,
+            commodity.sellPrice,
+            '('+sellColor+"{:+d}".format(diffSell)+c.ENDC+')',
+            td_levels[commodity.demandBracket],
+            commodity.buyPrice,
+            '('+buyColor+"{:+d}".format(diffBuy)+c.ENDC+')',
+            td_levels[commodity.stockBracket],
+            )
+        )
+    if header is True:
+        print("{:->25}-+{:->14}---+{:->14}---+".format(
+            '',
+            '',
+            ''
+        ))
+
+
+def marketPipeline(tdb, tdenv, c, snapshots=None, diff=True):
+    '''
+    A Pipeline importing markets into TD, plus the outputs enabled on the
+    command line. Price changes are printed unless diff is False. Without
+    a tdb only the outputs are fed. Returns the pipeline and its EDDN
+    sink, if --eddn is on.
+    '''
+    changes = None
+    if diff and tdb is not None:
+        changes = ChangeSink(
+            lambda place: currentPrices(tdb, place.stationID, snapshots),
+            lambda place, rows: printPriceChanges(rows, c),
+        )
+
+    if tdb is None:
+        prices = None
+    elif args.text_import:
+        prices = PricesTextSink(tdb, tdenv)
+    else:
+        prices = StationItemSink(
+            tdb,
+            tdenv,
+            ignoreUnknown=getattr(tdenv, 'ignoreUnknown', False),
+        )
+
+    eddnSink = None
+    if args.eddn:
+        eddnSink = EDDNSink(eddn.EDDN._levels)
+
+    # Loads numpy, if installed, so only when asked for.
+    history = None
+    if args.history:
+        from edapi_history import PriceHistory
+        history = HistorySink(PriceHistory(args.history))
+
+    # The snapshots and history only record what TD took.
+    pipeline = Pipeline(
+        name_table,
+        (
+            changes,
+            prices,
+            snapshots and SnapshotSink(snapshots),
+        ),
+        (
+            history,
+            args.csv and CSVSink(args.csv),
+            args.json and JSONSink(args.json),
+            eddnSink,
+        ),
+    )
+    return pipeline, eddnSink
+
+
+def postEDDN(profile, eddn_market, eddn_ships):
+    '''
+    Post the market, shipyard and outfitting of the docked station to the
+    EDDN.
+    '''
+    system = profile['lastSystem']['name']
+    station = profile['lastStarport']['name']
+
+    print('Posting prices to EDDN...')
+    con = eddn.EDDN(
+        profile['commander']['name'],
+        'EDAPI',
+        __version__
+    )
+    con._debug = args.debug
+    con.publishCommodities(
+        system,
+        station,
+        eddn_market
+    )
+    if (eddn_ships):
+        print('Posting shipyard to EDDN...')
+        con.publishShipyard(
+            system,
+            station,
+            eddn_ships
+        )
+
+    eddn_modules = []
+    for key in profile['lastStarport'].get('modules', ()):
+        key = int(key)
+        if key in modules:
+            eddn_modules.append(modules[key])
+    if len(eddn_modules):
+        print('Posting outfitting to EDDN...')
+        con.publishOutfitting(
+            system,
+            station,
+            eddn_modules
+        )
+
+
+def cookieFileFor(name):
+    '''
+    A batch entry is either a cookie file or a base name.
+    '''
+    if name.endswith('.cookies') or os.path.isfile(name):
+        return name
+    return name + '.cookies'
+
+
+def fetchProfiles(names, transport, c, stats=None):
+    '''
+    Fetch the profile of each commander in names, args.workers at a time.
+    Returns (name, profile, timestamp) in the order given, leaving out
+    the commanders whose fetch failed. The timestamp is when a profile
+    reused from the cache was fetched, or None.
+    '''
+    # Each commander gets a session of its own, so no HTTP session or
+    # cookie store is shared between requests in flight.
+    apis = []
+    for name in names:
+        cookiefile = cookieFileFor(name)
+        apis.append(EDAPI(
+            basename=os.path.splitext(cookiefile)[0],
+            debug=args.debug,
+            cookiefile=cookiefile,
+            transport=transport,
+            writeBehind=args.lazy_cookies,
+            fetch=False,
+            maxAge=0 if args.refresh else args.max_age,
+            stats=stats
+        ))
+
+    def failed(api, e):
+        print(
+            c.WARNING +
+            '{}: Unable to fetch the profile: {}'.format(api._cookiefile, e) +
+            c.ENDC
+        )
+
+    def fetch(api):
+        try:
+            api.profile = api.getProfile()
+        except (requests.exceptions.RequestException, SystemExit) as e:
+            failed(api, e)
+
+    fetching = [api for api in apis if api.profile is None]
+    print('Fetching {} profiles...'.format(len(fetching)))
+    workers = max(1, args.workers)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        if args.use_async:
+            import edapi_async
+            results = edapi_async.run(edapi_async.fetchAll(
+                [edapi_async.AsyncEDAPI(api, pool) for api in fetching],
+                limit=workers,
+                return_exceptions=True,
+            ))
+            for api, result in zip(fetching, results):
+                if isinstance(result, BaseException):
+                    failed(api, result)
+                else:
+                    api.profile = result['profile']
+        else:
+            list(pool.map(fetch, fetching))
+
+    fetched = [
+        (name, api) for name, api in zip(names, apis)
+        if api.profile is not None
+    ]
+
+    if args.archive:
+        archive = ProfileArchive(args.archive)
+        for name, api in fetched:
+            if not api.cached:
+                archive.append(api.profile)
+
+    return [(name, api.profile, api.timestamp) for name, api in fetched]
+
+
+def importBatch(profiles, c):
+    '''
+    Import the docked stations of several profiles in one TD session, with
+    all prices going through a single import.
+    '''
+    tdb = tdenv = snapshots = exporter = index = None
+    if not args.no_td:
+        tdb, tdenv = loadTD()
+        snapshots = openSnapshots(tdb)
+        exporter = CSVExporter(tdb, tdenv)
+        index = openStationIndex(tdb)
+
+    # Only one market per station can go in a .prices file. Later profiles
+    # win.
+    stations = {}
+    for name, profile, timestamp in profiles:
+        commander = profile['commander']
+        if not commander['docked']:
+            print(c.WARNING+name+': Commander not docked. Skipping.'+c.ENDC)
+            continue
+        key = (
+            profile['lastSystem']['name'].upper(),
+            profile['lastStarport']['name'].upper(),
+        )
+        stations[key] = (name, profile, timestamp)
+
+    print('Writing trade data...')
+    pipeline, eddnSink = marketPipeline(tdb, tdenv, c, snapshots)
+    posts = []
+    for name, profile, timestamp in stations.values():
+        print('Commander:', c.OKGREEN+profile['commander']['name']+c.ENDC)
+        print('System:', c.OKBLUE+profile['lastSystem']['name']+c.ENDC)
+        print('Station:', c.OKBLUE+profile['lastStarport']['name']+c.ENDC)
+
+        stationID = None
+        if tdb is None:
+            eddn_ships = [
+                eddn_ship_names[ship] for ship in shipyardShips(profile)
+            ]
+        else:
+            # An unknown system or ship only costs this one station.
+            try:
+                station_lookup = updateStation(
+                    tdb,
+                    tdenv,
+                    profile,
+                    c,
+                    exporter,
+                    index,
+                )
+                eddn_ships = updateShipyard(
+                    tdb,
+                    tdenv,
+                    profile,
+                    station_lookup,
+                    c,
+                    exporter,
+                )
+            except LookupError as e:
+                print(c.WARNING+name+': '+str(e)+'. Skipping.'+c.ENDC)
+                continue
+            stationID = station_lookup.ID
+
+        if 'commodities' not in profile['lastStarport']:
+            print(
+                c.FAIL +
+                'This station does not appear to have a commodity market.' +
+                c.ENDC
+            )
+            continue
+
+        # A profile reused from the cache went to the outputs and the EDDN
+        # in the run that fetched it.
+        place = placeOf(profile, stationID, timestamp)
+        pipeline.run(
+            place,
+            profile['lastStarport']['commodities'],
+            outputs=timestamp is None,
+        )
+        if timestamp is None:
+            posts.append((place, profile, eddn_ships))
+
+    if tdb is not None:
+        # Every changed station in one pass over the CSV files.
+        exporter.flush()
+        if posts:
+            print('Importing into Trade Dangerous...')
+    pipeline.close()
+
+    if args.eddn:
+        for place, profile, eddn_ships in posts:
+            postEDDN(profile, eddnSink.markets[place], eddn_ships)
+
+    return False
+
+
+def importReplay(path, c):
+    '''
+    Apply the newest market of every station found in path to TD in one
+    import.
+    '''
+    snapshots = newestSource(path)
+    print('Found {} stations to replay.'.format(len(snapshots)))
+
+    tdb, tdenv = loadTD()
+    tdenv.ignoreUnknown = True
+    index = openStationIndex(tdb)
+
+    print('Writing trade data...')
+    pipeline, eddnSink = marketPipeline(
+        tdb,
+        tdenv,
+        c,
+        openSnapshots(tdb),
+        diff=False,
+    )
+    count = 0
+    for timestamp, profile in snapshots:
+        system = profile['lastSystem']['name']
+        station = profile['lastStarport']['name']
+
+        # Stations are not added during a replay.
+        station_lookup = findStation(tdb, tdenv, index, system, station)
+        if station_lookup is None:
+            print(
+                c.WARNING +
+                'Skipping unknown station {}/{}.'.format(system, station) +
+                c.ENDC
+            )
+            continue
+
+        pipeline.run(
+            placeOf(profile, station_lookup.ID, timestamp),
+            profile['lastStarport']['commodities'],
+        )
+        count += 1
+
+    if count:
+        print('Replaying {} markets...'.format(count))
+    pipeline.close()
+
+    return False
+
+
 # ----------------------------------------------------------------
 # Main.
 # ----------------------------------------------------------------
@@ -3934,15 +4656,85 @@ def Main():
     # import.
     sys.path.insert(0, args.tdpath)
 
+    # edapi_async doesn't even parse on older versions.
+    if args.use_async and sys.version_info < (3, 7):
+        sys.exit('--async needs Python 3.7 or newer.')
+
+    # Rebuild TD prices from saved profiles.
+    if args.replay and args.no_td:
+        sys.exit('--replay imports into Trade Dangerous, so needs it.')
+    if args.replay:
+        return importReplay(args.replay, ansiColors())
+
+    # Report request timings however we exit.
+    stats = None
+    if args.stats:
+        stats = RequestStats()
+        atexit.register(printStats, stats, args.stats)
+
+    transport = TransportConfig(
+        connectTimeout=args.connect_timeout,
+        readTimeout=args.read_timeout,
+        retries=args.retries,
+        poolMaxsize=args.pool_size,
+    )
+
+    # Several commanders at once.
+    if args.batch:
+        c = ansiColors()
+        return importBatch(fetchProfiles(args.batch, transport, c, stats), c)
+
     # Connect to the API and grab all the info!
-    api = EDAPI(debug=args.debug, json_file=args.json_file)
+    api = EDAPI(
+        debug=args.debug,
+        json_file=args.json_file,
+        transport=transport,
+        writeBehind=args.lazy_cookies,
+        fetch=not args.use_async,
+        maxAge=0 if args.refresh else args.max_age,
+        stats=stats
+    )
+
+    # Fetch the profile through the asyncio client.
+    if args.use_async and api.profile is None:
+        import edapi_async
+        client = edapi_async.AsyncEDAPI(api)
+        try:
+            api.profile = edapi_async.run(client.profile())
+        finally:
+            client.close()
+
+    # Keep a copy of anything new.
+    if args.archive and not api.cached:
+        ProfileArchive(args.archive).append(api.profile)
 
     # User specified --export. Print JSON and exit.
-    if args.export:
+    if args.export and args.export_format == 'json':
         with open(args.export, 'w') as outfile:
             json.dump(api.profile, outfile, indent=4, sort_keys=True)
             sys.exit()
 
+    # Or the station tables in a bulk format.
+    if args.export:
+        import edapi_export
+        reason = edapi_export.missing(args.export_format)
+        if reason:
+            sys.exit(reason)
+        tables = edapi_export.exportTables(
+            api.profile,
+            name_table,
+            ship_names,
+            modules,
+            timestamp=api.timestamp,
+        )
+        for fname in edapi_export.writeExport(
+            args.export,
+            args.export_format,
+            tables,
+        ):
+            print('Wrote', fname)
+        sys.exit()
+
     # Colors
     c = ansiColors()
 
@@ -4037,224 +4829,35 @@ def Main():
                 )
             )
 
-    # Setup TD
-    print('Initializing Trade Dangerous...')
-    try:
-        import tradeenv
-    except:
-        sys.exit('Can\'t find Trade Dangerous. Do you need --tdpath?')
-    tdenv = tradeenv.TradeEnv()
-    if args.tdpath is not '.':
-        tdenv.dataDir = args.tdpath+'/data'
-    import tradedb
-    tdb = tradedb.TradeDB(tdenv)
-    import cache
-    import csvexport
-
-    # Check to see if this system is in the Stations file
-    try:
-        station_lookup = tdb.lookupStation(station, system)
-    except:
-        station_lookup = None
-
-    # The station isn't in the stations file. Add it.
-    if not station_lookup:
-        print(c.WARNING+'WARNING! Station unknown.'+c.ENDC)
-        print('Adding station...')
-        lsFromStar = input(
-            "Distance from star (enter for 0): "
-        ) or 0
-        try:
-            lsFromStar = int(float(lsFromStar))
-        except:
-            print("That doesn't seem to be a number. Defaulting to zero.")
-            lsFromStar = 0
-        blackMarket = input(
-            "Black market present (Y, N or enter for ?): "
-        ) or '?'
-        maxPadSize = input(
-            "Max pad size (S, M, L or enter for ?): "
-        ) or '?'
-        outfitting = input(
-            "Outfitting present (Y, N or enter for ?): "
-        ) or '?'
-        rearm = input(
-            "Rearm present (Y, N or enter for ?): "
-        ) or '?'
-        refuel = input(
-            "Refuel present (Y, N or enter for ?): "
-        ) or '?'
-        repair = input(
-            "Repair present (Y, N or enter for ?): "
-        ) or '?'
-        planetary = input(
-            "Planetary Station (Y, N or enter for ?): "
-        ) or '?'
-        # This is unreliable, so ask the user.
-        if 'commodities' in api.profile['lastStarport']:
-            market = 'Y'
-        else:
-            market = input(
-                "Commodity market present (Y, N or enter for ?): "
-            ) or '?'
-        # This is also unreliable, so ask the user.
-        if 'ships' in api.profile['lastStarport']:
-            shipyard = 'Y'
-        else:
-            shipyard = input(
-                "Shipyard present (Y, N or enter for ?): "
-            ) or '?'
-        system_lookup = tdb.lookupSystem(system)
-        if tdb.addLocalStation(
-            system=system_lookup,
-            name=station,
-            lsFromStar=lsFromStar,
-            blackMarket=blackMarket,
-            maxPadSize=maxPadSize,
-            market=market,
-            shipyard=shipyard,
-            outfitting=outfitting,
-            rearm=rearm,
-            refuel=refuel,
-            repair=repair,
-            planetary=planetary
-        ):
-            lines, csvPath = csvexport.exportTableToFile(
-                tdb,
-                tdenv,
-                "Station"
-            )
-            tdenv.NOTE("{} updated.", csvPath)
-        station_lookup = tdb.lookupStation(station, system)
+    # Without TD, go straight from the profile to the other outputs.
+    tdb = tdenv = snapshots = stationID = None
+    if args.no_td:
+        eddn_ships = [
+            eddn_ship_names[ship] for ship in shipyardShips(api.profile)
+        ]
     else:
-        print(c.OKGREEN+'Station found in station file.'+c.ENDC)
-
-        # See if we need to update the info for this station.
-        lsFromStar = station_lookup.lsFromStar
-        blackMarket = station_lookup.blackMarket
-        maxPadSize = station_lookup.maxPadSize
-        market = station_lookup.market
-        shipyard = station_lookup.shipyard
-        outfitting = station_lookup.outfitting
-        rearm = station_lookup.rearm
-        refuel = station_lookup.refuel
-        repair = station_lookup.repair
-        planetary = station_lookup.planetary
-
-        if lsFromStar == 0:
-            lsFromStar = input(
-                "Update distance from star (enter for 0): "
-            ) or 0
-            lsFromStar = int(lsFromStar)
-        if blackMarket is '?':
-            blackMarket = input(
-                "Update black market present (Y, N or enter for ?): "
-            ) or '?'
-        if maxPadSize is '?':
-            maxPadSize = input(
-                "Update max pad size (S, M, L or enter for ?): "
-            ) or '?'
-        if outfitting is '?':
-            outfitting = input(
-                "Update outfitting present (Y, N or enter for ?): "
-            ) or '?'
-        if rearm is '?':
-            rearm = input(
-                "Update rearm present (Y, N or enter for ?): "
-            ) or '?'
-        if refuel is '?':
-            refuel = input(
-                "Update refuel present (Y, N or enter for ?): "
-            ) or '?'
-        if repair is '?':
-            repair = input(
-                "Update repair present (Y, N or enter for ?): "
-            ) or '?'
-        if planetary is '?':
-            planetary = input(
-                "Update planetary (Y, N or enter for ?): "
-            ) or '?'
-        # This is unreliable, so ask the user if unknown.
-        if 'commodities' in api.profile['lastStarport']:
-            market = 'Y'
-        else:
-            if market is '?':
-                market = input(
-                    "Commodity market present (Y, N or enter for ?): "
-                ) or '?'
-        # This is also unreliable, so ask the user if unknown.
-        if 'ships' in api.profile['lastStarport']:
-            shipyard = 'Y'
-        else:
-            if shipyard is '?':
-                shipyard = input(
-                    "Shipyard present (Y, N or enter for ?): "
-                ) or '?'
-        if (
-            lsFromStar != station_lookup.lsFromStar or
-            blackMarket != station_lookup.blackMarket or
-            maxPadSize != station_lookup.maxPadSize or
-            market != station_lookup.market or
-            shipyard != station_lookup.shipyard or
-            outfitting != station_lookup.outfitting or
-            rearm != station_lookup.rearm or
-            refuel != station_lookup.refuel or
-            repair != station_lookup.repair or
-            planetary != station_lookup.planetary
-        ):
-            if tdb.updateLocalStation(
-                station=station_lookup,
-                lsFromStar=lsFromStar,
-                blackMarket=blackMarket,
-                maxPadSize=maxPadSize,
-                market=market,
-                shipyard=shipyard,
-                outfitting=outfitting,
-                rearm=rearm,
-                refuel=refuel,
-                repair=repair,
-                planetary=planetary
-            ):
-                lines, csvPath = csvexport.exportTableToFile(
-                    tdb,
-                    tdenv,
-                    "Station"
-                )
-                tdenv.NOTE("{} updated.", csvPath)
-
-    # If a shipyard exists, update the ship vendor csv
-    eddn_ships = []
-    if 'ships' in api.profile['lastStarport']:
-        print(c.OKGREEN+'Found a shipyard at this station.'+c.ENDC)
-        ships = list(
-            api.profile['lastStarport']['ships']['shipyard_list'].keys()
+        tdb, tdenv = loadTD()
+        snapshots = openSnapshots(tdb)
+
+        exporter = CSVExporter(tdb, tdenv)
+        station_lookup = updateStation(
+            tdb,
+            tdenv,
+            api.profile,
+            c,
+            exporter,
+            openStationIndex(tdb),
         )
-        for ship in api.profile['lastStarport']['ships']['unavailable_list']:
-            ships.append(ship['name'])
-
-        for ship in ships:
-            eddn_ships.append(eddn_ship_names[ship])
-
-        if args.ships:
-            print(c.OKBLUE+'Updating ShipVendor.csv...'+c.ENDC)
-            db = tdb.getDB()
-            for ship in ships:
-                ship_lookup = tdb.lookupShip(ship_names[ship])
-                db.execute("""
-                           REPLACE INTO ShipVendor
-                           (ship_id, station_id)
-                           VALUES
-                           (?, ?)
-                           """,
-                           (ship_lookup.ID, station_lookup.ID))
-                db.commit()
-            tdenv.NOTE("Updated {} ships in {} shipyard.", len(ships), station)
-            lines, csvPath = csvexport.exportTableToFile(
-                tdb,
-                tdenv,
-                "ShipVendor",
-            )
-            tdenv.NOTE("{} updated.", csvPath)
+        eddn_ships = updateShipyard(
+            tdb,
+            tdenv,
+            api.profile,
+            station_lookup,
+            c,
+            exporter,
+        )
+        exporter.flush()
+        stationID = station_lookup.ID
 
     # Some sanity checking on the market
     if 'commodities' not in api.profile['lastStarport']:
@@ -4268,210 +4871,31 @@ def Main():
         sys.exit(1)
 
     # Station exists. Import.
-    # Grab the old prices so we can print a comparison.
-    db = tdb.getDB()
-    oldPrices = {n: (s, b) for (n, s, b) in db.execute(
-        """
-        SELECT
-            Item.name,
-            StationItem.demand_price,
-            StationItem.supply_price
-        FROM
-            StationItem,
-            System,
-            Station,
-            Item
-        WHERE
-            Item.item_id = StationItem.item_id AND
-            System.name = ? AND
-            Station.name = ? AND
-            System.system_id = Station.system_id AND
-            Station.station_id = StationItem.station_id
-        ORDER BY Item.ui_order
-        """,
-        (
-            system,
-            station
-        )
-    )}
-
     print('Writing trade data...')
-
-    # Find a temp file
-    f = tempfile.NamedTemporaryFile(delete=False)
-    if args.debug:
-        print('Temp file is:', f.name)
-
-    # Write out trade data
-    header = False
-    f.write("@ {}/{}\n".format(system, station).encode('UTF-8'))
-    eddn_market = []
-    for commodity in api.profile['lastStarport']['commodities']:
-        if commodity['categoryname'] in cat_ignore:
-            continue
-
-        if commodity['name'] in comm_ignore:
-            continue
-
-        if commodity['categoryname'] in cat_correct:
-            commodity['categoryname'] = cat_correct[commodity['categoryname']]
-
-        if commodity['name'] in comm_correct:
-            commodity['name'] = comm_correct[commodity['name']]
-
-        def commodity_int(key):
-            try:
-                commodity[key] = int(commodity[key])
-            except (ValueError, KeyError):
-                commodity[key] = 0
-
-        commodity_int('stock')
-        commodity_int('demand')
-        commodity_int('demandBracket')
-        commodity_int('stockBracket')
-        commodity_int('buyPrice')
-        commodity_int('sellPrice')
-
-        # Populate EDDN
-        if args.eddn:
-            eddn_market.append(
-                {
-                    "name": commodity['name'],
-                    "buyPrice": commodity['buyPrice'],
-                    "supply": commodity['stock'],
-                    "supplyLevel": eddn.EDDN._levels[commodity['stockBracket']],  # NOQA
-                    "sellPrice": commodity['sellPrice'],
-                    "demand": commodity['demand'],
-                    "demandLevel": eddn.EDDN._levels[commodity['demandBracket']]  # NOQA
-                }
-            )
-
-        f.write(
-            "\t+ {}\n".format(
-                commodity['categoryname']
-            ).encode('UTF-8')
-        )
-
-        # If stock is zero, list it as unavailable.
-        # If the stockBracket is zero, ignore any stock.
-        if not commodity['stock'] or not commodity['stockBracket']:
-            commodity['stock'] = '-'
-        else:
-            demand = bracket_levels[commodity['stockBracket']]
-            commodity['stock'] = str(commodity['stock'])+demand
-
-        # If demand is zero, list as unknown.
-        if not (commodity['demand'] and commodity['demandBracket']):
-            commodity['demand'] = '?'
-        else:
-            demand = bracket_levels[commodity['demandBracket']]
-            commodity['demand'] = str(commodity['demand'])+demand
-
-        # Print price differences
-        oldCom = oldPrices.get(commodity['name'], (0, 0))
-        diffSell = commodity['sellPrice'] - oldCom[0]
-        diffBuy = commodity['buyPrice'] - oldCom[1]
-
-        # Only print if the prices changed.
-        if (diffSell != 0 or diffBuy != 0):
-            if header is False:
-                header = True
-                print("Price fluctuations:")
-                print("{:->25}-+{:->14}---+{:->14}---+".format(
-                    'Commodity',
-                    'Sell Price',
-                    'Buy Price'
-                ))
-            if diffSell < 0:
-                sellColor = c.FAIL
-            elif diffSell > 0:
-                sellColor = c.OKGREEN
-            else:
-                sellColor = c.ENDC
-            if diffBuy > 0:
-                buyColor = c.FAIL
-            elif diffBuy < 0:
-                buyColor = c.OKGREEN
-            else:
-                buyColor = c.ENDC
-            if args.nocolor:
-                s = "{:>25} | {:>5}{:<8} {} | {:>5}{:<8} {} |"
-            else:
-                s = "{:>25} | {:>5}{:<18} {} | {:>5}{:<18} {} |"
-            print(s.format(
-                commodity['name'],
-                commodity['sellPrice'],
-                '('+sellColor+"{:+d}".format(diffSell)+c.ENDC+')',
-                bracket_levels[commodity['demandBracket']],
-                commodity['buyPrice'],
-                '('+buyColor+"{:+d}".format(diffBuy)+c.ENDC+')',
-                bracket_levels[commodity['stockBracket']],
-                )
-            )
-
-        f.write(
-            "\t\t{} {} {} {} {}\n".format(
-                commodity['name'],
-                commodity['sellPrice'],
-                commodity['buyPrice'],
-                commodity['demand'],
-                commodity['stock'],
-            ).encode('UTF-8')
-        )
-    f.close()
-    if header is True:
-        print("{:->25}-+{:->14}---+{:->14}---+".format(
-            '',
-            '',
-            ''
-        ))
+    pipeline, eddnSink = marketPipeline(tdb, tdenv, c, snapshots)
+    # A profile reused from the cache keeps the time it was fetched, and
+    # went to the outputs and the EDDN in the run that fetched it.
+    place = placeOf(api.profile, stationID, api.timestamp)
+    pipeline.run(
+        place,
+        api.profile['lastStarport']['commodities'],
+        outputs=not api.cached,
+    )
 
     # All went well. Try the import.
-    print('Importing into Trade Dangerous...')
-
-    # TD likes to use Path objects
-    fpath = Path(f.name)
-
-    # Ask TD to parse the system from the temp file.
-    cache.importDataFromFile(tdb, tdenv, fpath)
-
-    # Remove the temp file.
-    fpath.unlink()
+    if tdb is not None:
+        print('Importing into Trade Dangerous...')
+    pipeline.close()
 
     # Post to EDDN
-    if args.eddn:
-        print('Posting prices to EDDN...')
-        con = eddn.EDDN(
-            api.profile['commander']['name'],
-            'EDAPI',
-            __version__
-        )
-        con._debug = args.debug
-        con.publishCommodities(
-            system,
-            station,
-            eddn_market
+    if args.eddn and api.cached:
+        print(
+            c.WARNING +
+            'Profile reused from the cache. Not posting to EDDN.' +
+            c.ENDC
         )
-        if (eddn_ships):
-            print('Posting shipyard to EDDN...')
-            con.publishShipyard(
-                system,
-                station,
-                eddn_ships
-            )
-
-        eddn_modules = []
-        for key in api.profile['lastStarport'].get('modules', ()):
-            key = int(key)
-            if key in modules:
-                eddn_modules.append(modules[key])
-        if len(eddn_modules):
-            print('Posting outfitting to EDDN...')
-            con.publishOutfitting(
-                system,
-                station,
-                eddn_modules
-            )
+    elif args.eddn:
+        postEDDN(api.profile, eddnSink.markets[place], eddn_ships)
 
     # No errors.
     return False
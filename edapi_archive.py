@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------
+# Append-only, compressed archive of /profile responses.
+#
+# Every profile is written as its own gzip member holding one JSON
+# line, so the whole file is a normal .jsonl.gz that zcat can read.
+# A side index records where each member starts, which lets a
+# single snapshot be read back without decompressing the rest.
+# ----------------------------------------------------------------
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+import zlib
+
+__version_info__ = ('3', '6', '1')
+__version__ = '.'.join(__version_info__)
+
+
+class Entry:
+    '''
+    One line of the archive index.
+    '''
+
+    __slots__ = ('timestamp', 'system', 'station', 'offset', 'length')
+
+    def __init__(self, timestamp, system, station, offset, length):
+        self.timestamp = timestamp
+        self.system = system
+        self.station = station
+        self.offset = offset
+        self.length = length
+
+    @classmethod
+    def parse(cls, line):
+        timestamp, system, station, offset, length = line.rstrip('\n').split('\t')  # NOQA
+        return cls(int(timestamp), system, station, int(offset), int(length))
+
+    def format(self):
+        return '{}\t{}\t{}\t{}\t{}\n'.format(
+            self.timestamp,
+            self.system,
+            self.station,
+            self.offset,
+            self.length,
+        )
+
+    def __str__(self):
+        return '{} {}/{} @{}'.format(
+            time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(self.timestamp)),
+            self.system,
+            self.station,
+            self.offset,
+        )
+
+
+def _place(profile):
+    '''
+    The system and station names of a profile, tabs removed.
+    '''
+    system = profile.get('lastSystem', {}).get('name', '')
+    station = profile.get('lastStarport', {}).get('name', '')
+    return system.replace('\t', ' '), station.replace('\t', ' ')
+
+
+class ProfileArchive:
+    '''
+    A gzip compressed JSON lines archive of profiles with an index of
+    (timestamp, system, station) to byte offsets.
+    '''
+
+    def __init__(self, path):
+        '''
+        Initialize
+        '''
+        self.path = str(path)
+        self.indexPath = self.path + '.idx'
+
+    def append(self, profile, timestamp=None):
+        '''
+        Add a profile to the archive. Returns its index entry.
+        '''
+        if timestamp is None:
+            timestamp = time.time()
+        timestamp = int(timestamp)
+
+        record = json.dumps(
+            {'timestamp': timestamp, 'profile': profile},
+            separators=(',', ':'),
+        )
+        data = gzip.compress((record + '\n').encode('utf-8'))
+
+        with open(self.path, 'ab') as h:
+            offset = h.tell()
+            h.write(data)
+
+        system, station = _place(profile)
+        entry = Entry(timestamp, system, station, offset, len(data))
+        with open(self.indexPath, 'a', encoding='utf-8') as h:
+            h.write(entry.format())
+
+        return entry
+
+    def entries(self):
+        '''
+        All index entries, oldest first. The index is rebuilt if it is
+        missing or out of step with the archive.
+        '''
+        try:
+            with open(self.indexPath, encoding='utf-8') as h:
+                entries = [Entry.parse(line) for line in h if line.strip()]
+        except FileNotFoundError:
+            entries = None
+
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return []
+
+        if entries is None or (
+            (entries[-1].offset + entries[-1].length if entries else 0) != size
+        ):
+            entries = self.rebuildIndex()
+
+        return entries
+
+    def find(self, system=None, station=None, since=None, until=None):
+        '''
+        Index entries matching the given place and time range. Names are
+        not case sensitive.
+        '''
+        system = system and system.upper()
+        station = station and station.upper()
+        return [
+            e for e in self.entries()
+            if (system is None or e.system.upper() == system) and
+            (station is None or e.station.upper() == station) and
+            (since is None or e.timestamp >= since) and
+            (until is None or e.timestamp <= until)
+        ]
+
+    def read(self, entry):
+        '''
+        Read the profile of one index entry.
+        '''
+        with open(self.path, 'rb') as h:
+            h.seek(entry.offset)
+            data = h.read(entry.length)
+        return json.loads(gzip.decompress(data).decode('utf-8'))['profile']
+
+    def __iter__(self):
+        '''
+        Yield (entry, profile) for every snapshot, oldest first.
+        '''
+        with open(self.path, 'rb') as h:
+            for entry in self.entries():
+                h.seek(entry.offset)
+                data = gzip.decompress(h.read(entry.length))
+                yield entry, json.loads(data.decode('utf-8'))['profile']
+
+    def rebuildIndex(self):
+        '''
+        Recreate the index by scanning the archive member by member. A
+        member torn by an interrupted write is skipped, and the scan goes
+        on from the next gzip header, as append() writes after it.
+        '''
+        entries = []
+        with open(self.path, 'rb') as h:
+            offset = 0
+            while offset is not None:
+                member = _readMember(h, offset)
+                try:
+                    record = json.loads(member[0].decode('utf-8'))
+                    profile = record['profile']
+                except (TypeError, ValueError, KeyError):
+                    offset = _findMember(h, offset + 1)
+                    continue
+
+                length = member[1]
+                system, station = _place(profile)
+                entries.append(
+                    Entry(record['timestamp'], system, station, offset, length)
+                )
+                offset += length
+
+        with open(self.indexPath, 'w', encoding='utf-8') as h:
+            h.writelines(e.format() for e in entries)
+
+        return entries
+
+
+# The first bytes of a gzip member: magic number and deflate method.
+GZIP_HEADER = b'\x1f\x8b\x08'
+
+
+def _readMember(h, offset):
+    '''
+    Decompress the gzip member starting at offset of an open file. Returns
+    (data, compressed length), or None if there is no whole member there.
+    '''
+    h.seek(offset)
+    d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    parts = []
+    consumed = 0
+    try:
+        while not d.eof:
+            chunk = h.read(65536)
+            if not chunk:
+                return None
+            parts.append(d.decompress(chunk))
+            consumed += len(chunk)
+    except zlib.error:
+        return None
+    return b''.join(parts), consumed - len(d.unused_data)
+
+
+def _findMember(h, offset):
+    '''
+    The offset of the next gzip header at or after offset, or None.
+    '''
+    keep = len(GZIP_HEADER) - 1
+    h.seek(offset)
+    tail = b''
+    while True:
+        chunk = h.read(65536)
+        if not chunk:
+            return None
+        data = tail + chunk
+        found = data.find(GZIP_HEADER)
+        if found >= 0:
+            return offset - len(tail) + found
+        tail = data[-keep:]
+        offset += len(chunk)
+
+
+# ----------------------------------------------------------------
+# Functions.
+# ----------------------------------------------------------------
+
+
+def parse_args():
+    '''
+    Parse arguments.
+    '''
+    # Basic argument parsing.
+    parser = argparse.ArgumentParser(
+        description='List or extract profiles from an EDAPI archive.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    # Version
+    parser.add_argument('--version',
+                        action='version',
+                        version='%(prog)s '+__version__)
+
+    # Archive
+    parser.add_argument("archive",
+                        help="Archive file written by edapi.py --archive.")
+
+    # Filters
+    parser.add_argument("--system",
+                        default=None,
+                        help="Only snapshots taken in this system.")
+    parser.add_argument("--station",
+                        default=None,
+                        help="Only snapshots taken at this station.")
+
+    # Extract
+    parser.add_argument("--extract",
+                        metavar="FILE",
+                        default=None,
+                        help="Write the newest matching profile to FILE as\
+                        JSON instead of listing the snapshots. Use - for\
+                        stdout.")
+
+    # Parse the command line.
+    return parser.parse_args()
+
+
+def Main():
+    '''
+    Main function.
+    '''
+    args = parse_args()
+    archive = ProfileArchive(args.archive)
+    entries = archive.find(system=args.system, station=args.station)
+
+    if args.extract is None:
+        for entry in entries:
+            print(entry)
+        return False
+
+    if not entries:
+        sys.exit('No matching snapshot.')
+
+    profile = archive.read(entries[-1])
+    if args.extract == '-':
+        json.dump(profile, sys.stdout, indent=4, sort_keys=True)
+    else:
+        with open(args.extract, 'w') as outfile:
+            json.dump(profile, outfile, indent=4, sort_keys=True)
+    return False
+
+
+# ----------------------------------------------------------------
+# __main__
+# ----------------------------------------------------------------
+if __name__ == "__main__":
+    sys.exit(Main())
@@ -0,0 +1,187 @@
+# ----------------------------------------------------------------
+# asyncio front end for EDAPI sessions. Lets many companion API
+# requests, for one or many commanders, run concurrently on one
+# event loop.
+#
+# Requires Python 3.7 or newer. Check before importing it.
+# ----------------------------------------------------------------
+
+import asyncio
+import threading
+
+from edapi_transport import AUTH_OK, Transport, authState
+
+
+class AsyncEDAPI:
+    '''
+    Issues companion API requests for an EDAPI session from asyncio.
+
+    The session is an EDAPI instance created with fetch=False. Its
+    blocking requests run in an executor so the loop is free to drive
+    other requests and other sessions meanwhile. Login and cookie
+    handling are the ones of the wrapped session.
+
+    The first request goes through the session itself, alone, as it may
+    have to log in. After that each request in flight gets a transport of
+    its own, with a copy of the session cookies, so no HTTP session is
+    shared between threads. Cookies it brings back are merged into the
+    session and its cookie store under a lock.
+    '''
+
+    def __init__(self, api, executor=None):
+        '''
+        Initialize
+        '''
+        self.api = api
+        self.executor = executor
+
+        # Guards the session's own transport, cookie jar and store.
+        self._sessionLock = threading.Lock()
+
+        # Idle transports for requests after the first.
+        self._idle = []
+        self._idleLock = threading.Lock()
+
+        # Created on first use so it belongs to the running loop.
+        self._authLock = None
+        self._authenticated = False
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def _viaSession(self, uri, values=None):
+        with self._sessionLock:
+            return self.api._getURI(uri, values=values)
+
+    def _transport(self):
+        with self._idleLock:
+            if self._idle:
+                return self._idle.pop()
+        opener = self.api.opener
+        return Transport(
+            self.api._agent,
+            opener.config,
+            debug=opener.debug,
+            stats=opener.stats,
+        )
+
+    def _request(self, uri, values=None):
+        transport = self._transport()
+        try:
+            with self._sessionLock:
+                transport.cookies = self.api.opener.cookies.copy()
+
+            url = self.api._baseurl + uri
+            if values is None:
+                response = transport.get(url, label=uri)
+            else:
+                response = transport.post(url, values, label=uri)
+
+            with self._sessionLock:
+                self.api.opener.cookies.update(transport.cookies)
+                self.api.cookies.update(self.api.opener.cookies)
+        finally:
+            with self._idleLock:
+                self._idle.append(transport)
+
+        # Logged out meanwhile: let the session log in again.
+        if authState(response) != AUTH_OK:
+            response.close()
+            return self._viaSession(uri, values)
+        return response
+
+    async def get(self, uri, values=None):
+        '''
+        GET (or POST, if values are given) a companion API URI.
+        '''
+        if not self._authenticated:
+            if self._authLock is None:
+                self._authLock = asyncio.Lock()
+            async with self._authLock:
+                if not self._authenticated:
+                    response = await self._run(self._viaSession, uri, values)
+                    self._authenticated = True
+                    return response
+
+        return await self._run(self._request, uri, values)
+
+    async def json(self, uri, values=None):
+        '''
+        Fetch a companion API URI and decode the JSON response.
+        '''
+        response = await self.get(uri, values)
+        return response.json()
+
+    async def profile(self):
+        '''
+        Fetch the commander /profile.
+        '''
+        profile = await self.json('profile')
+        cache = getattr(self.api, 'profileCache', None)
+        if cache is not None:
+            cache.store(profile)
+        return profile
+
+    async def _fetch(self, uri):
+        if uri == 'profile':
+            return await self.profile()
+        return await self.json(uri)
+
+    async def fetch(self, *uris):
+        '''
+        Fetch several companion API URIs concurrently. Returns a dict of
+        decoded responses keyed by URI.
+        '''
+        if not self._authenticated and uris:
+            first = await self._fetch(uris[0])
+            rest = await asyncio.gather(*(self._fetch(u) for u in uris[1:]))
+            return dict(zip(uris, [first] + list(rest)))
+
+        results = await asyncio.gather(*(self._fetch(u) for u in uris))
+        return dict(zip(uris, results))
+
+    def close(self):
+        '''
+        Close the transports opened for concurrent requests.
+        '''
+        with self._idleLock:
+            idle, self._idle = self._idle, []
+        for transport in idle:
+            transport.close()
+
+
+async def fetchAll(
+    clients,
+    uris=('profile',),
+    limit=None,
+    return_exceptions=False
+):
+    '''
+    Fetch the given URIs for every client concurrently, at most limit
+    sessions at a time. Returns a list of dicts in client order. With
+    return_exceptions, a client that fails gives its exception instead
+    of stopping the others.
+    '''
+    semaphore = asyncio.Semaphore(limit) if limit else None
+
+    async def one(client):
+        try:
+            if semaphore is None:
+                return await client.fetch(*uris)
+            async with semaphore:
+                return await client.fetch(*uris)
+        finally:
+            client.close()
+
+    return await asyncio.gather(
+        *(one(c) for c in clients),
+        return_exceptions=return_exceptions
+    )
+
+
+def run(coroutine):
+    '''
+    Run a coroutine to completion on a fresh event loop.
+    '''
+    return asyncio.run(coroutine)
@@ -0,0 +1,240 @@
+# ----------------------------------------------------------------
+# Incremental export of TD's Station.csv and ShipVendor.csv.
+#
+# csvexport.exportTableToFile() writes a whole table for every
+# station changed. Here the stations changed during a run are
+# collected and, at the end, only their lines are replaced in the
+# CSV files, or appended if they are new. The rows are built from
+# the file's own header, so a header this code does not understand,
+# or every COMPACT_EVERY patches, falls back to a full export from
+# TD, which also restores TD's row order.
+# ----------------------------------------------------------------
+
+import csv
+import io
+import json
+import os
+import re
+
+# Patches between full exports.
+COMPACT_EVERY = 50
+
+STATE_FILE = 'edapi.csvstate'
+
+# The leading columns naming a station in each table. Its lines start
+# with these values.
+_stationColumns = {
+    'Station': ('unq:name@System.system_id', 'unq:name'),
+    'ShipVendor': (
+        'unq:name@System.system_id',
+        'unq:name@Station.station_id',
+    ),
+}
+
+_identifier = re.compile(r'^\w+$')
+
+
+class UnknownFormat(ValueError):
+    '''
+    A CSV file that can't be patched.
+    '''
+
+
+def _columns(db, table):
+    return [row[1] for row in db.execute('PRAGMA table_info({})'.format(table))]
+
+
+def selectFor(db, table, header):
+    '''
+    A SELECT giving the rows of table in the column layout of a TD CSV
+    header, for the stations bound to its "?" list. Raises UnknownFormat
+    for columns it can't resolve.
+    '''
+    if not _identifier.match(table):
+        raise UnknownFormat(table)
+    columns = set(_columns(db, table))
+    if 'station_id' not in columns:
+        raise UnknownFormat(table)
+
+    exprs = []
+    for spec in header:
+        spec = spec[4:] if spec.startswith('unq:') else spec
+        if '@' not in spec:
+            if spec not in columns:
+                raise UnknownFormat(spec)
+            exprs.append('t.' + spec)
+            continue
+
+        # "name@System.system_id" is the name of the System row whose
+        # system_id matches ours, or our station's.
+        column, _, ref = spec.partition('@')
+        refTable, _, key = ref.partition('.')
+        if not all(map(_identifier.match, (column, refTable, key))):
+            raise UnknownFormat(spec)
+        if key in columns:
+            exprs.append(
+                '(SELECT r.{c} FROM {t} r WHERE r.{k} = t.{k})'.format(
+                    c=column, t=refTable, k=key
+                )
+            )
+        elif key in _columns(db, 'Station'):
+            exprs.append(
+                '(SELECT r.{c} FROM {t} r JOIN Station s ON s.{k} = r.{k}'
+                ' WHERE s.station_id = t.station_id)'.format(
+                    c=column, t=refTable, k=key
+                )
+            )
+        else:
+            raise UnknownFormat(spec)
+
+    return 'SELECT {} FROM {} t WHERE t.station_id IN ({{}})'.format(
+        ', '.join(exprs),
+        table,
+    )
+
+
+class CSVExporter:
+    '''
+    Collects the stations whose Station or ShipVendor rows changed and
+    brings the CSV files up to date when flushed.
+    '''
+
+    compactEvery = COMPACT_EVERY
+
+    def __init__(self, tdb, tdenv):
+        '''
+        Initialize
+        '''
+        self.tdb = tdb
+        self.tdenv = tdenv
+        self.statePath = os.path.join(str(tdb.dataPath), STATE_FILE)
+        self.changed = {}
+
+    def mark(self, table, stationID):
+        '''
+        Note that the rows of a station changed in table.
+        '''
+        self.changed.setdefault(table, set()).add(stationID)
+
+    def flush(self):
+        '''
+        Export every marked table. Returns the paths written.
+        '''
+        paths = []
+        state = self._loadState()
+        for table, stationIDs in sorted(self.changed.items()):
+            patches = state.get(table, 0)
+            path = None
+            if patches < self.compactEvery:
+                try:
+                    path = self.patch(table, stationIDs)
+                    state[table] = patches + 1
+                except (OSError, UnknownFormat, csv.Error) as e:
+                    self.tdenv.DEBUG0("Full {} export: {}", table, e)
+            if path is None:
+                path = self.export(table)
+                state[table] = 0
+            self.tdenv.NOTE("{} updated.", path)
+            paths.append(path)
+        self.changed = {}
+        if paths:
+            self._saveState(state)
+        return paths
+
+    def export(self, table):
+        '''
+        Have TD write the whole table.
+        '''
+        import csvexport
+
+        lines, csvPath = csvexport.exportTableToFile(
+            self.tdb,
+            self.tdenv,
+            table,
+        )
+        return csvPath
+
+    def patch(self, table, stationIDs):
+        '''
+        Replace the lines of the given stations in the CSV of table, or
+        append them if there are none. Raises UnknownFormat if the file
+        can't be patched.
+        '''
+        path = os.path.join(str(self.tdb.dataPath), table + '.csv')
+        with open(path, encoding='utf-8', newline='') as h:
+            text = h.read()
+        lines = text.splitlines(keepends=True)
+        if not lines:
+            raise UnknownFormat('empty file')
+
+        # Write lines the way the file was written.
+        quote = lines[0][0]
+        if quote not in '\'"':
+            raise UnknownFormat('unquoted header')
+        newline = '\r\n' if lines[0].endswith('\r\n') else '\n'
+        header = next(csv.reader([lines[0]], quotechar=quote))
+        if tuple(header[:2]) != _stationColumns.get(table):
+            raise UnknownFormat(header[:2])
+
+        db = self.tdb.getDB()
+        stationIDs = sorted(stationIDs)
+        marks = ','.join('?' * len(stationIDs))
+        prefixes = tuple(
+            self._format(quote, newline, row).rstrip(newline) + ','
+            for row in db.execute(
+                """
+                SELECT sy.name, st.name
+                FROM Station st JOIN System sy ON sy.system_id = st.system_id
+                WHERE st.station_id IN ({})
+                """.format(marks),
+                stationIDs,
+            )
+        )
+        new = [
+            self._format(quote, newline, row)
+            for row in db.execute(
+                selectFor(db, table, header).format(marks),
+                stationIDs,
+            )
+        ]
+
+        kept = [line for line in lines[1:] if not line.startswith(prefixes)]
+        if len(kept) == len(lines) - 1:
+            # Only new stations: append.
+            with open(path, 'a', encoding='utf-8', newline='') as h:
+                if not text.endswith(('\n', '\r')):
+                    h.write(newline)
+                h.writelines(new)
+            return path
+
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8', newline='') as h:
+            h.write(lines[0])
+            h.writelines(kept)
+            if kept and not kept[-1].endswith(('\n', '\r')):
+                h.write(newline)
+            h.writelines(new)
+        os.replace(tmp, path)
+        return path
+
+    def _format(self, quote, newline, row):
+        f = io.StringIO()
+        csv.writer(
+            f,
+            quotechar=quote,
+            doublequote=True,
+            quoting=csv.QUOTE_NONNUMERIC,
+            lineterminator=newline,
+        ).writerow(row)
+        return f.getvalue()
+
+    def _loadState(self):
+        try:
+            with open(self.statePath) as h:
+                return json.load(h)
+        except (OSError, ValueError):
+            return {}
+
+    def _saveState(self, state):
+        with open(self.statePath, 'w') as h:
+            json.dump(state, h)
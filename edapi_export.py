@@ -0,0 +1,481 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------
+# Market, shipyard and outfitting exports for bulk analysis.
+#
+# The docked station is flattened into three tables of plain rows
+# and written as CSV, msgpack or a columnar file. Parquet is used
+# for columnar exports when pyarrow is installed; otherwise a packed
+# layout is written: a small JSON header, then every column as one
+# little-endian array, with strings stored as indices into a list
+# of their distinct values.
+# ----------------------------------------------------------------
+
+import argparse
+import array
+import csv
+import json
+import os
+import struct
+import sys
+import time
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from edapi_market import normalizeMarket
+
+__version_info__ = ('3', '6', '1')
+__version__ = '.'.join(__version_info__)
+
+FORMATS = ('json', 'csv', 'msgpack', 'columnar')
+EXPORT_VERSION = 1
+
+# Column names and types of every table.
+TABLES = {
+    'market': (
+        ('timestamp', 'int'),
+        ('system', 'str'),
+        ('station', 'str'),
+        ('category', 'str'),
+        ('name', 'str'),
+        ('sellPrice', 'int'),
+        ('buyPrice', 'int'),
+        ('demand', 'int'),
+        ('demandBracket', 'int'),
+        ('stock', 'int'),
+        ('stockBracket', 'int'),
+    ),
+    'shipyard': (
+        ('timestamp', 'int'),
+        ('system', 'str'),
+        ('station', 'str'),
+        ('ship', 'str'),
+        ('available', 'bool'),
+    ),
+    'outfitting': (
+        ('timestamp', 'int'),
+        ('system', 'str'),
+        ('station', 'str'),
+        ('id', 'int'),
+        ('category', 'str'),
+        ('name', 'str'),
+        ('class', 'str'),
+        ('rating', 'str'),
+        ('ship', 'str'),
+        ('mount', 'str'),
+        ('guidance', 'str'),
+    ),
+}
+
+# Packed columnar file header: magic, format version, JSON length.
+PACKED_MAGIC = b'EDPK'
+PACKED_HEADER = struct.Struct('<4sII')
+PACKED_TYPES = {'int': 'q', 'bool': 'B', 'str': 'I'}
+
+
+def missing(fmt):
+    '''
+    Why fmt can't be written here, or None if it can.
+    '''
+    if fmt == 'msgpack' and msgpack is None:
+        return 'The msgpack export needs the msgpack module.'
+    return None
+
+
+def exportTables(profile, names, shipNames, modules, timestamp=None):
+    '''
+    The market, shipyard and outfitting of the docked station as a dict
+    of table name to a list of row tuples, in the column order of TABLES.
+    shipNames maps API ship names to TD ones and modules maps module IDs
+    to their descriptions.
+    '''
+    if timestamp is None:
+        timestamp = time.time()
+    timestamp = int(timestamp)
+    system = profile['lastSystem']['name']
+    starport = profile['lastStarport']
+    station = starport['name']
+    prefix = (timestamp, system, station)
+
+    market = [
+        prefix + (
+            c.category,
+            c.name,
+            c.sellPrice,
+            c.buyPrice,
+            c.demand,
+            c.demandBracket,
+            c.stock,
+            c.stockBracket,
+        )
+        for c in normalizeMarket(starport.get('commodities', ()), names)
+    ]
+
+    shipyard = []
+    ships = starport.get('ships')
+    if ships:
+        for ship in ships['shipyard_list']:
+            shipyard.append(prefix + (shipNames.get(ship, ship), True))
+        for ship in ships['unavailable_list']:
+            ship = ship['name']
+            shipyard.append(prefix + (shipNames.get(ship, ship), False))
+
+    outfitting = []
+    for key in starport.get('modules', ()):
+        module = modules.get(int(key), {})
+        outfitting.append(prefix + (int(key),) + tuple(
+            module.get(field, '')
+            for field, _ in TABLES['outfitting'][4:]
+        ))
+
+    return {
+        'market': market,
+        'shipyard': shipyard,
+        'outfitting': outfitting,
+    }
+
+
+def columns(table, rows):
+    '''
+    The rows of a table as a dict of column name to list of values.
+    '''
+    fields = [field for field, _ in TABLES[table]]
+    if not rows:
+        return {field: [] for field in fields}
+    return dict(zip(fields, map(list, zip(*rows))))
+
+
+def tablePath(path, table, ext):
+    '''
+    The file of one table for formats holding a single table per file,
+    "exports/lave.csv" giving "exports/lave-market.csv".
+    '''
+    root, _ = os.path.splitext(path)
+    return '{}-{}{}'.format(root, table, ext)
+
+
+# ----------------------------------------------------------------
+# Writers.
+# ----------------------------------------------------------------
+
+
+def writeCSV(path, tables):
+    '''
+    Write every table to its own CSV file. Returns the files written.
+    '''
+    paths = []
+    for table, rows in tables.items():
+        fname = tablePath(path, table, '.csv')
+        with open(fname, 'w', newline='', encoding='utf-8') as h:
+            writer = csv.writer(h)
+            writer.writerow([field for field, _ in TABLES[table]])
+            writer.writerows(rows)
+        paths.append(fname)
+    return paths
+
+
+def writeMsgpack(path, tables):
+    '''
+    Write every table to one msgpack file. Returns the files written.
+    '''
+    data = {
+        'version': EXPORT_VERSION,
+        'tables': {
+            table: {
+                'fields': [field for field, _ in TABLES[table]],
+                'rows': rows,
+            }
+            for table, rows in tables.items()
+        },
+    }
+    with open(path, 'wb') as h:
+        h.write(msgpack.packb(data, use_bin_type=True))
+    return [path]
+
+
+def writeParquet(path, tables):
+    '''
+    Write every table to its own Parquet file. Returns the files written.
+    '''
+    types = {
+        'int': pyarrow.int64(),
+        'bool': pyarrow.bool_(),
+        'str': pyarrow.string(),
+    }
+    paths = []
+    for table, rows in tables.items():
+        schema = pyarrow.schema([
+            (field, types[kind]) for field, kind in TABLES[table]
+        ])
+        fname = tablePath(path, table, '.parquet')
+        pyarrow.parquet.write_table(
+            pyarrow.Table.from_pydict(columns(table, rows), schema=schema),
+            fname,
+        )
+        paths.append(fname)
+    return paths
+
+
+def writePacked(path, tables):
+    '''
+    Write every table to one packed columnar file. Returns the files
+    written.
+    '''
+    header = {'tables': []}
+    chunks = []
+    offset = 0
+    for table, rows in tables.items():
+        entry = {'name': table, 'rows': len(rows), 'columns': []}
+        for field, values in columns(table, rows).items():
+            kind = dict(TABLES[table])[field]
+            column = {'name': field, 'type': kind, 'offset': offset}
+            if kind == 'str':
+                index = {}
+                values = [index.setdefault(v, len(index)) for v in values]
+                column['values'] = list(index)
+            data = array.array(PACKED_TYPES[kind], values)
+            if sys.byteorder == 'big':
+                data.byteswap()
+            data = data.tobytes()
+            chunks.append(data)
+            offset += len(data)
+            entry['columns'].append(column)
+        header['tables'].append(entry)
+
+    header = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    with open(path, 'wb') as h:
+        h.write(PACKED_HEADER.pack(PACKED_MAGIC, EXPORT_VERSION, len(header)))
+        h.write(header)
+        h.writelines(chunks)
+    return [path]
+
+
+def writeColumnar(path, tables):
+    '''
+    Write Parquet files when pyarrow is installed, a packed file otherwise.
+    Returns the files written.
+    '''
+    if pyarrow is not None:
+        return writeParquet(path, tables)
+    return writePacked(path, tables)
+
+
+writers = {
+    'csv': writeCSV,
+    'msgpack': writeMsgpack,
+    'columnar': writeColumnar,
+}
+
+
+def writeExport(path, fmt, tables):
+    '''
+    Write tables to path in one of FORMATS other than json. Returns the
+    files written.
+    '''
+    return writers[fmt](path, tables)
+
+
+# ----------------------------------------------------------------
+# Readers.
+# ----------------------------------------------------------------
+
+
+def readCSV(path):
+    '''
+    The tables written by writeCSV, as a dict of table name to lists of
+    string rows.
+    '''
+    tables = {}
+    for table in TABLES:
+        fname = tablePath(path, table, '.csv')
+        if os.path.exists(fname):
+            with open(fname, newline='', encoding='utf-8') as h:
+                tables[table] = list(csv.reader(h))[1:]
+    return tables
+
+
+def readMsgpack(path):
+    '''
+    The tables written by writeMsgpack, as a dict of table name to lists
+    of rows.
+    '''
+    with open(path, 'rb') as h:
+        data = msgpack.unpackb(h.read(), raw=False)
+    if data.get('version') != EXPORT_VERSION:
+        raise ValueError(
+            '{}: not a version {} export.'.format(path, EXPORT_VERSION)
+        )
+    return {
+        table: content['rows'] for table, content in data['tables'].items()
+    }
+
+
+def readPacked(path):
+    '''
+    The tables written by writePacked, as a dict of table name to dicts of
+    column name to column. Columns are NumPy arrays when NumPy is
+    installed, lists otherwise.
+    '''
+    with open(path, 'rb') as h:
+        data = h.read()
+    magic, version, size = PACKED_HEADER.unpack_from(data)
+    if magic != PACKED_MAGIC or version != EXPORT_VERSION:
+        raise ValueError(
+            '{}: not a version {} packed export.'.format(path, EXPORT_VERSION)
+        )
+    header = json.loads(data[PACKED_HEADER.size:PACKED_HEADER.size + size])
+    start = PACKED_HEADER.size + size
+
+    tables = {}
+    for entry in header['tables']:
+        table = {}
+        for column in entry['columns']:
+            code = PACKED_TYPES[column['type']]
+            offset = start + column['offset']
+            count = entry['rows']
+            if numpy is not None:
+                values = numpy.frombuffer(
+                    data,
+                    dtype=numpy.dtype('<' + code),
+                    count=count,
+                    offset=offset,
+                )
+                if column['type'] == 'str':
+                    values = numpy.array(column['values'], dtype=object)[values]
+                elif column['type'] == 'bool':
+                    values = values.astype(bool)
+            else:
+                values = array.array(code)
+                values.frombytes(
+                    data[offset:offset + count * values.itemsize]
+                )
+                if sys.byteorder == 'big':
+                    values.byteswap()
+                if column['type'] == 'str':
+                    names = column['values']
+                    values = [names[i] for i in values]
+                elif column['type'] == 'bool':
+                    values = [bool(v) for v in values]
+                else:
+                    values = values.tolist()
+            table[column['name']] = values
+        tables[entry['name']] = table
+    return tables
+
+
+def readParquet(path):
+    '''
+    The tables written by writeParquet, as a dict of table name to
+    pyarrow Tables.
+    '''
+    tables = {}
+    for table in TABLES:
+        fname = tablePath(path, table, '.parquet')
+        if os.path.exists(fname):
+            tables[table] = pyarrow.parquet.read_table(fname)
+    return tables
+
+
+def readColumnar(path):
+    '''
+    The tables written by writeColumnar.
+    '''
+    if os.path.exists(path):
+        with open(path, 'rb') as h:
+            if h.read(len(PACKED_MAGIC)) == PACKED_MAGIC:
+                return readPacked(path)
+    return readParquet(path)
+
+
+readers = {
+    'csv': readCSV,
+    'msgpack': readMsgpack,
+    'columnar': readColumnar,
+}
+
+
+def readExport(path, fmt):
+    '''
+    Read back an export written by writeExport().
+    '''
+    return readers[fmt](path)
+
+
+# ----------------------------------------------------------------
+# Functions.
+# ----------------------------------------------------------------
+
+
+def parse_args():
+    '''
+    Parse arguments.
+    '''
+    # Basic argument parsing.
+    parser = argparse.ArgumentParser(
+        description='Print a market export written by edapi.py.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    # Version
+    parser.add_argument('--version',
+                        action='version',
+                        version='%(prog)s '+__version__)
+
+    # Export
+    parser.add_argument("export",
+                        help="File given to edapi.py --export.")
+    parser.add_argument("--format",
+                        choices=FORMATS[1:],
+                        default='columnar',
+                        help="Format given to edapi.py --export-format.")
+    parser.add_argument("--table",
+                        choices=sorted(TABLES),
+                        default='market',
+                        help="Table to print.")
+
+    # Parse the command line.
+    return parser.parse_args()
+
+
+def Main():
+    '''
+    Main function.
+    '''
+    args = parse_args()
+    table = readExport(args.export, args.format).get(args.table)
+    if table is None:
+        return False
+
+    fields = [field for field, _ in TABLES[args.table]]
+    if isinstance(table, dict):
+        rows = zip(*(table[field] for field in fields))
+    elif pyarrow is not None and isinstance(table, pyarrow.Table):
+        rows = zip(*(table.column(field).to_pylist() for field in fields))
+    else:
+        rows = table
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow(row)
+    return False
+
+
+# ----------------------------------------------------------------
+# __main__
+# ----------------------------------------------------------------
+if __name__ == "__main__":
+    sys.exit(Main())
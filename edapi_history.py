@@ -0,0 +1,423 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------
+# Append-only price history of imported markets.
+#
+# Every commodity of every imported market is one fixed-width
+# record, so the file can be memory-mapped and scanned (with NumPy
+# when it is installed) without parsing. Station and commodity
+# names are stored once each in a side table and referred to by
+# number.
+# ----------------------------------------------------------------
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__version_info__ = ('3', '6', '1')
+__version__ = '.'.join(__version_info__)
+
+# File header: magic and format version.
+MAGIC = b'EDPH'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sI')
+
+# timestamp, place, item, sell, buy, demand, stock, demand bracket,
+# stock bracket, padding.
+RECORD = struct.Struct('<IIIIIIIBB2x')
+
+if numpy is not None:
+    RECORD_DTYPE = numpy.dtype([
+        ('timestamp', '<u4'),
+        ('place', '<u4'),
+        ('item', '<u4'),
+        ('sell', '<u4'),
+        ('buy', '<u4'),
+        ('demand', '<u4'),
+        ('stock', '<u4'),
+        ('demandBracket', 'u1'),
+        ('stockBracket', 'u1'),
+        ('pad', 'V2'),
+    ])
+
+
+class Price:
+    '''
+    One commodity price of the history.
+    '''
+
+    __slots__ = (
+        'timestamp',
+        'place',
+        'item',
+        'sell',
+        'buy',
+        'demand',
+        'stock',
+        'demandBracket',
+        'stockBracket',
+    )
+
+    def __init__(
+        self,
+        timestamp,
+        place,
+        item,
+        sell,
+        buy,
+        demand,
+        stock,
+        demandBracket,
+        stockBracket
+    ):
+        self.timestamp = timestamp
+        self.place = place
+        self.item = item
+        self.sell = sell
+        self.buy = buy
+        self.demand = demand
+        self.stock = stock
+        self.demandBracket = demandBracket
+        self.stockBracket = stockBracket
+
+    def __str__(self):
+        return '{} {:<40} {:<30} {:>7} {:>7} {:>8} {:>8}'.format(
+            time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(self.timestamp)),
+            self.place.lstrip('@'),
+            self.item,
+            self.sell,
+            self.buy,
+            self.demand,
+            self.stock,
+        )
+
+
+class PriceHistory:
+    '''
+    A file of fixed-width price records, plus FILE.names holding the
+    station ("@System/Station", as in .prices files) and commodity names
+    they refer to.
+    '''
+
+    def __init__(self, path):
+        '''
+        Initialize
+        '''
+        self.path = str(path)
+        self.namesPath = self.path + '.names'
+        self._names = None
+        self._index = None
+
+    # ------------------------------------------------------------
+    # Names.
+    # ------------------------------------------------------------
+
+    def names(self):
+        '''
+        Every name, by number.
+        '''
+        if self._names is None:
+            try:
+                with open(self.namesPath, encoding='utf-8') as h:
+                    self._names = h.read().splitlines()
+            except FileNotFoundError:
+                self._names = []
+            self._index = {n: i for i, n in enumerate(self._names)}
+        return self._names
+
+    def _numbers(self, wanted):
+        '''
+        The numbers of the names in wanted, adding any new ones.
+        '''
+        names = self.names()
+        new = [n for n in dict.fromkeys(wanted) if n not in self._index]
+        if new:
+            with open(self.namesPath, 'a', encoding='utf-8') as h:
+                h.writelines(n + '\n' for n in new)
+            for n in new:
+                self._index[n] = len(names)
+                names.append(n)
+        return [self._index[n] for n in wanted]
+
+    def _find(self, name):
+        '''
+        The numbers of the commodity names matching name, ignoring case.
+        '''
+        name = name.upper()
+        return [
+            i for i, n in enumerate(self.names())
+            if n.upper() == name and not n.startswith('@')
+        ]
+
+    # ------------------------------------------------------------
+    # Writing.
+    # ------------------------------------------------------------
+
+    def append(self, system, station, market, timestamp=None):
+        '''
+        Add every Commodity of a market seen at system/station. Returns
+        the number of records written.
+        '''
+        if timestamp is None:
+            timestamp = time.time()
+        timestamp = int(timestamp)
+
+        commodities = list(market)
+        numbers = self._numbers(
+            ['@{}/{}'.format(system, station)] +
+            [c.name for c in commodities]
+        )
+        place, items = numbers[0], numbers[1:]
+
+        data = b''.join(
+            RECORD.pack(
+                timestamp,
+                place,
+                item,
+                max(0, c.sellPrice),
+                max(0, c.buyPrice),
+                max(0, c.demand),
+                max(0, c.stock),
+                c.demandBracket,
+                c.stockBracket,
+            )
+            for item, c in zip(items, commodities)
+        )
+
+        with open(self.path, 'ab') as h:
+            size = h.tell()
+            if size == 0:
+                h.write(HEADER.pack(MAGIC, FORMAT_VERSION))
+            else:
+                # Drop a record torn by an interrupted write so the new
+                # ones stay aligned.
+                torn = (size - HEADER.size) % RECORD.size
+                if torn:
+                    h.truncate(size - torn)
+            h.write(data)
+
+        return len(items)
+
+    # ------------------------------------------------------------
+    # Reading.
+    # ------------------------------------------------------------
+
+    def _map(self, h):
+        '''
+        Memory-map an open history file. Returns None if it holds no
+        records.
+        '''
+        size = os.fstat(h.fileno()).st_size
+        if size < HEADER.size + RECORD.size:
+            return None
+        mapped = mmap.mmap(h.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = HEADER.unpack_from(mapped)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            mapped.close()
+            raise ValueError(
+                '{}: not a version {} price history.'.format(
+                    self.path,
+                    FORMAT_VERSION,
+                )
+            )
+        return mapped
+
+    def _select(self, places, items, since):
+        '''
+        The raw records matching the given name numbers (None for any) and
+        time, as tuples in file order.
+        '''
+        try:
+            h = open(self.path, 'rb')
+        except FileNotFoundError:
+            return []
+
+        with h:
+            mapped = self._map(h)
+            if mapped is None:
+                return []
+            count = (len(mapped) - HEADER.size) // RECORD.size
+
+            if numpy is not None:
+                records = numpy.frombuffer(
+                    mapped,
+                    dtype=RECORD_DTYPE,
+                    count=count,
+                    offset=HEADER.size,
+                )
+                mask = numpy.ones(count, dtype=bool)
+                if places is not None:
+                    mask &= numpy.isin(records['place'], places)
+                if items is not None:
+                    mask &= numpy.isin(records['item'], items)
+                if since is not None:
+                    mask &= records['timestamp'] >= since
+                # Indexing copies, so the map can be closed.
+                selected = [
+                    tuple(r)[:-1] for r in records[mask].tolist()
+                ]
+                del records
+            else:
+                places = places and frozenset(places)
+                items = items and frozenset(items)
+                selected = [
+                    r for r in RECORD.iter_unpack(
+                        mapped[HEADER.size:HEADER.size + count * RECORD.size]
+                    )
+                    if (places is None or r[1] in places) and
+                    (items is None or r[2] in items) and
+                    (since is None or r[0] >= since)
+                ]
+            mapped.close()
+
+        return selected
+
+    def prices(self, system=None, station=None, item=None, since=None):
+        '''
+        The recorded prices of a commodity, a station, or both, oldest
+        first. Names are not case sensitive; None matches anything.
+        '''
+        places = None
+        if system is not None or station is not None:
+            places = [
+                i for i, n in enumerate(self.names())
+                if n.startswith('@') and
+                (system is None or
+                    n[1:].split('/', 1)[0].upper() == system.upper()) and
+                (station is None or
+                    n[1:].split('/', 1)[1].upper() == station.upper())
+            ]
+            if not places:
+                return []
+        items = None
+        if item is not None:
+            items = self._find(item)
+            if not items:
+                return []
+
+        names = self.names()
+        return [
+            Price(
+                r[0], names[r[1]], names[r[2]],
+                r[3], r[4], r[5], r[6], r[7], r[8],
+            )
+            for r in sorted(
+                self._select(places, items, since),
+                key=lambda r: r[0],
+            )
+        ]
+
+    def changes(self, system=None, station=None, item=None, count=10):
+        '''
+        The last count prices that differ from the one recorded before them
+        for the same station and commodity, oldest first.
+        '''
+        last = {}
+        changed = []
+        for price in self.prices(system, station, item):
+            key = (price.place, price.item)
+            before = last.get(key)
+            if before is not None and (
+                before.sell != price.sell or before.buy != price.buy
+            ):
+                changed.append(price)
+            last[key] = price
+        return changed[-count:] if count else changed
+
+
+# ----------------------------------------------------------------
+# Functions.
+# ----------------------------------------------------------------
+
+
+def parse_args():
+    '''
+    Parse arguments.
+    '''
+    # Basic argument parsing.
+    parser = argparse.ArgumentParser(
+        description='Query an EDAPI price history.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    # Version
+    parser.add_argument('--version',
+                        action='version',
+                        version='%(prog)s '+__version__)
+
+    # History
+    parser.add_argument("history",
+                        help="History file written by edapi.py --history.")
+
+    # Filters
+    parser.add_argument("--system",
+                        default=None,
+                        help="Only prices seen in this system.")
+    parser.add_argument("--station",
+                        default=None,
+                        help="Only prices seen at this station.")
+    parser.add_argument("--item",
+                        default=None,
+                        help="Only prices of this commodity.")
+    parser.add_argument("--days",
+                        type=float,
+                        default=None,
+                        help="Only prices from the last DAYS days.")
+
+    # Changes
+    parser.add_argument("--changes",
+                        metavar="N",
+                        type=int,
+                        default=None,
+                        help="List the last N price changes instead of every\
+                        recorded price.")
+
+    # Parse the command line.
+    return parser.parse_args()
+
+
+def Main():
+    '''
+    Main function.
+    '''
+    args = parse_args()
+    history = PriceHistory(args.history)
+
+    if args.changes is not None:
+        prices = history.changes(
+            system=args.system,
+            station=args.station,
+            item=args.item,
+            count=args.changes,
+        )
+    else:
+        since = None
+        if args.days is not None:
+            since = int(time.time() - args.days * 86400)
+        prices = history.prices(
+            system=args.system,
+            station=args.station,
+            item=args.item,
+            since=since,
+        )
+
+    print('{:<19} {:<40} {:<30} {:>7} {:>7} {:>8} {:>8}'.format(
+        'Time', 'Station', 'Commodity', 'Sell', 'Buy', 'Demand', 'Stock'
+    ))
+    for price in prices:
+        print(price)
+    return False
+
+
+# ----------------------------------------------------------------
+# __main__
+# ----------------------------------------------------------------
+if __name__ == "__main__":
+    sys.exit(Main())
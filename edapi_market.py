@@ -0,0 +1,241 @@
+# ----------------------------------------------------------------
+# Commodity market normalization. Turns the commodity list of a
+# /profile into one column per field, applying the TD name fixes
+# of an edapi_names.NameTable and number coercion to whole columns
+# at a time, and into one immutable record per commodity. The raw
+# profile is never modified.
+#
+# NumPy is used for the numeric columns of long markets when it is
+# installed. It is only imported once such a market comes along.
+# ----------------------------------------------------------------
+
+import collections
+
+from edapi_names import DROP
+
+# TD's suffixes for the API's supply and demand brackets.
+td_levels = ('-', 'L', 'M', 'H')
+
+# The integer fields of an API commodity.
+int_fields = (
+    'buyPrice',
+    'sellPrice',
+    'demand',
+    'demandBracket',
+    'stock',
+    'stockBracket',
+)
+
+# Markets shorter than this are quicker to normalize as plain lists.
+VECTORIZE_MIN = 256
+
+# The numpy module, None if it isn't installed, or False until looked for.
+_numpy = False
+
+
+def numpyModule():
+    '''
+    NumPy, imported on first use, or None if it isn't installed.
+    '''
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return 0
+
+
+def groupLines(commodities, suffix='', order=None):
+    '''
+    The TD .prices lines of some Commodity records grouped by category, as
+    a list of (category, lines) with the categories sorted by name. order
+    is a dict of upper case commodity names to TD ui_order. Commodities it
+    knows come first in that order, the rest follow in the order given.
+    '''
+    groups = {}
+    for index, c in enumerate(commodities):
+        rank = order.get(c.name.upper()) if order else None
+        if rank is None:
+            key = (1, 0, index)
+        else:
+            key = (0, rank, index)
+        groups.setdefault(c.category, []).append((key, c.tdLine(suffix)))
+
+    return [
+        (category, [line for key, line in sorted(rows)])
+        for category, rows in sorted(groups.items())
+    ]
+
+
+class Commodity(collections.namedtuple('Commodity', (
+    'name',
+    'category',
+    'buyPrice',
+    'sellPrice',
+    'demand',
+    'demandBracket',
+    'stock',
+    'stockBracket',
+))):
+    '''
+    One normalized commodity, with TD names and int fields. The TD line,
+    EDDN entry and price change row are all built from it.
+    '''
+
+    __slots__ = ()
+
+    @property
+    def tdDemand(self):
+        '''
+        TD demand text. Zero demand is listed as unknown.
+        '''
+        if self.demand and self.demandBracket:
+            return '{}{}'.format(self.demand, td_levels[self.demandBracket])
+        return '?'
+
+    @property
+    def tdStock(self):
+        '''
+        TD supply text. Zero stock is listed as unavailable.
+        '''
+        if self.stock and self.stockBracket:
+            return '{}{}'.format(self.stock, td_levels[self.stockBracket])
+        return '-'
+
+    def tdLine(self, suffix=''):
+        '''
+        The commodity in TD .prices format. The suffix is added to the
+        line, e.g. a timestamp.
+        '''
+        return "\t\t{} {} {} {} {}{}\n".format(
+            self.name,
+            self.sellPrice,
+            self.buyPrice,
+            self.tdDemand,
+            self.tdStock,
+            suffix,
+        )
+
+    def eddn(self, levels):
+        '''
+        The commodity as an EDDN dict. levels maps API brackets to EDDN
+        level names.
+        '''
+        return {
+            "name": self.name,
+            "buyPrice": self.buyPrice,
+            "supply": self.stock,
+            "supplyLevel": levels[self.stockBracket],
+            "sellPrice": self.sellPrice,
+            "demand": self.demand,
+            "demandLevel": levels[self.demandBracket],
+        }
+
+
+# A commodity whose prices changed, and by how much.
+PriceChange = collections.namedtuple(
+    'PriceChange',
+    ('commodity', 'diffSell', 'diffBuy'),
+)
+
+
+class Market:
+    '''
+    The normalized commodities of one market in API order. Kept as one
+    list (or NumPy array for numbers) per field for whole market work,
+    and iterated as Commodity records for everything done one commodity
+    at a time.
+    '''
+
+    def __init__(self, names, categories, columns, vectorized=False):
+        '''
+        Initialize
+        '''
+        self.names = names
+        self.categories = categories
+        self.vectorized = vectorized
+        self.buyPrice = columns['buyPrice']
+        self.sellPrice = columns['sellPrice']
+        self.demand = columns['demand']
+        self.demandBracket = columns['demandBracket']
+        self.stock = columns['stock']
+        self.stockBracket = columns['stockBracket']
+        self._records = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.records())
+
+    def column(self, field):
+        '''
+        A field of every commodity as a plain list.
+        '''
+        column = getattr(self, field)
+        return column.tolist() if self.vectorized else column
+
+    def records(self):
+        '''
+        The commodities as a tuple of Commodity records, built once.
+        '''
+        if self._records is None:
+            self._records = tuple(map(
+                Commodity,
+                self.names,
+                self.categories,
+                self.column('buyPrice'),
+                self.column('sellPrice'),
+                self.column('demand'),
+                self.column('demandBracket'),
+                self.column('stock'),
+                self.column('stockBracket'),
+            ))
+        return self._records
+
+
+def normalizeMarket(commodities, names, vectorize=None):
+    '''
+    Build a Market from the API commodity list without modifying it.
+
+    names is an edapi_names.NameTable. It is reloaded first if its file
+    changed, then gives the TD category and name of each commodity, or
+    drops it. The numeric fields become ints, 0 when missing or not a
+    number. NumPy arrays are used when vectorize is true, or when it is
+    None, NumPy is installed and the market has at least VECTORIZE_MIN
+    commodities.
+    '''
+    names.refresh()
+    lookup = names.lookup
+    rows = []
+    tdNames = []
+    categories = []
+    for c in commodities:
+        fixed = lookup(c['categoryname'], c['name'])
+        if fixed is DROP:
+            continue
+        rows.append(c)
+        categories.append(fixed[0])
+        tdNames.append(fixed[1])
+
+    if vectorize is None:
+        vectorize = len(rows) >= VECTORIZE_MIN and numpyModule() is not None
+    numpy = numpyModule() if vectorize else None
+
+    columns = {}
+    for field in int_fields:
+        column = [_int(c.get(field)) for c in rows]
+        if vectorize:
+            column = numpy.array(column, dtype=numpy.int64)
+        columns[field] = column
+
+    return Market(tdNames, categories, columns, vectorized=vectorize)
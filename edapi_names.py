@@ -0,0 +1,114 @@
+# ----------------------------------------------------------------
+# Name fixes between TD, ED and the API.
+#
+# The ignore lists and corrections live in edapi_names.json so the
+# command line tool and the TD plugin share one copy, and so they
+# can be changed without a new release. Each (category, name) pair
+# is resolved once and remembered, after which it costs a single
+# dict lookup.
+# ----------------------------------------------------------------
+
+import json
+import os
+
+# The edapi_names.json format this module reads.
+NAMES_VERSION = 1
+
+# The default table, next to this module.
+NAMES_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'edapi_names.json',
+)
+
+# What NameTable.lookup() returns for a commodity TD should not see.
+DROP = None
+
+
+class NameTable:
+    '''
+    The compiled name fixes of an edapi_names.json file.
+    '''
+
+    def __init__(self, path=NAMES_FILE):
+        '''
+        Initialize
+        '''
+        self.path = str(path)
+        self.mtime = None
+        self.load()
+
+    def load(self):
+        '''
+        (Re)read the data file. Raises ValueError if it is not a version
+        this module understands.
+        '''
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, encoding='utf-8') as h:
+            data = json.load(h)
+
+        if data.get('version') != NAMES_VERSION:
+            raise ValueError(
+                '{}: unsupported version {!r}, expected {}.'.format(
+                    self.path,
+                    data.get('version'),
+                    NAMES_VERSION,
+                )
+            )
+
+        categories = data.get('categories', {})
+        commodities = data.get('commodities', {})
+
+        # Swap everything in at once so concurrent lookups see either the
+        # old table or the new one.
+        self._table = ({}, (
+            frozenset(categories.get('ignore', ())),
+            dict(categories.get('correct', {})),
+            frozenset(commodities.get('ignore', ())),
+            dict(commodities.get('correct', {})),
+        ))
+        self.mtime = mtime
+
+    def refresh(self):
+        '''
+        Reload the data file if it changed since it was last read. A file
+        that can't be read or parsed leaves the current table in place.
+        Returns True if the table was reloaded.
+        '''
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self.mtime:
+            return False
+
+        try:
+            self.load()
+        except (OSError, ValueError) as e:
+            # Don't try again until the file changes once more.
+            self.mtime = mtime
+            print('Keeping the previous name table:', e)
+            return False
+        return True
+
+    def lookup(self, category, name):
+        '''
+        The TD (category, name) of an API commodity, or DROP if it is to
+        be ignored.
+        '''
+        compiled, rules = self._table
+        key = (category, name)
+        try:
+            return compiled[key]
+        except KeyError:
+            pass
+
+        cat_ignore, cat_correct, comm_ignore, comm_correct = rules
+        if category in cat_ignore or name in comm_ignore:
+            result = DROP
+        else:
+            result = (
+                cat_correct.get(category, category),
+                comm_correct.get(name, name),
+            )
+        compiled[key] = result
+        return result
@@ -0,0 +1,399 @@
+# ----------------------------------------------------------------
+# Streaming market pipeline. A source yields profiles, each market
+# is normalized as columns by edapi_market, and every commodity is
+# handed once to each enabled sink: TD prices, EDDN, price changes,
+# snapshots, history, CSV or JSON.
+#
+# A sink that isn't enabled is never created, so it costs nothing.
+# New outputs are new Sink classes, not new loops.
+# ----------------------------------------------------------------
+
+import collections
+import csv
+import json
+import os
+import time
+
+from edapi_archive import ProfileArchive
+from edapi_market import PriceChange, normalizeMarket
+
+# Where a market was seen. stationID is the TD station ID, if known, and
+# timestamp is None for "now".
+Place = collections.namedtuple(
+    'Place',
+    ('system', 'station', 'stationID', 'timestamp'),
+)
+
+
+def placeOf(profile, stationID=None, timestamp=None):
+    '''
+    The Place of the docked station of a profile.
+    '''
+    return Place(
+        profile['lastSystem']['name'],
+        profile['lastStarport']['name'],
+        stationID,
+        timestamp,
+    )
+
+
+# ----------------------------------------------------------------
+# Sources.
+# ----------------------------------------------------------------
+
+
+def _docked(profile):
+    return (
+        profile['commander']['docked'] and
+        'commodities' in profile['lastStarport']
+    )
+
+
+def fileSource(path):
+    '''
+    Yield (timestamp, profile) for every exported JSON profile in a
+    directory, or in a single file. File modification times are used as
+    the timestamps.
+    '''
+    if os.path.isdir(path):
+        fnames = [
+            os.path.join(path, name)
+            for name in sorted(os.listdir(path))
+            if name.endswith('.json')
+        ]
+    else:
+        fnames = [path]
+
+    for fname in fnames:
+        try:
+            with open(fname) as h:
+                profile = json.load(h)
+        except ValueError:
+            print('Skipping {}: not valid JSON.'.format(fname))
+            continue
+        yield int(os.path.getmtime(fname)), profile
+
+
+def newestSource(path):
+    '''
+    The newest docked snapshot of every station found in a directory of
+    exported JSON profiles or in a profile archive, as (timestamp,
+    profile) pairs, oldest first.
+    '''
+    newest = {}
+
+    if os.path.isdir(path):
+        for timestamp, profile in fileSource(path):
+            if not _docked(profile):
+                continue
+            key = (
+                profile['lastSystem']['name'].upper(),
+                profile['lastStarport']['name'].upper(),
+            )
+            if key not in newest or newest[key][0] < timestamp:
+                newest[key] = (timestamp, profile)
+    else:
+        # The index tells us where each station was seen, so only the
+        # snapshots we keep have to be decompressed.
+        archive = ProfileArchive(path)
+        seen = {}
+        for entry in archive.entries():
+            key = (entry.system.upper(), entry.station.upper())
+            seen.setdefault(key, []).append(entry)
+        for key, entries in seen.items():
+            for entry in sorted(entries, key=lambda e: -e.timestamp):
+                profile = archive.read(entry)
+                if _docked(profile):
+                    newest[key] = (entry.timestamp, profile)
+                    break
+
+    return sorted(newest.values(), key=lambda s: s[0])
+
+
+# ----------------------------------------------------------------
+# Pipeline.
+# ----------------------------------------------------------------
+
+
+class Sink:
+    '''
+    Receives the markets run through a Pipeline. For each market, start()
+    is called, then add() with every commodity, then finish(). close() is
+    called once at the end. Subclasses override what they need.
+    '''
+
+    def start(self, place):
+        pass
+
+    def add(self, commodity):
+        pass
+
+    def finish(self, place):
+        pass
+
+    def close(self):
+        pass
+
+
+class Pipeline:
+    '''
+    Normalizes markets and feeds them to a list of sinks. None entries in
+    sinks are skipped, so optional sinks can be listed as
+    "Sink() if enabled else None".
+
+    outputs are sinks that record or publish every market they see, such
+    as history, CSV, JSON and EDDN. A market that was already seen by an
+    earlier run can be kept from them.
+    '''
+
+    def __init__(self, names, sinks=(), outputs=()):
+        '''
+        Initialize
+        '''
+        self.names = names
+        self.sinks = [s for s in sinks if s is not None]
+        self.outputs = [s for s in outputs if s is not None]
+
+    def run(self, place, commodities, outputs=True):
+        '''
+        Feed one market, an API commodity list, through the sinks, and
+        through the outputs unless outputs is False. Returns the number of
+        commodities passed on.
+        '''
+        sinks = self.sinks + self.outputs if outputs else self.sinks
+        adds = [s.add for s in sinks]
+
+        for sink in sinks:
+            sink.start(place)
+        count = 0
+        for commodity in normalizeMarket(commodities, self.names):
+            for add in adds:
+                add(commodity)
+            count += 1
+        for sink in sinks:
+            sink.finish(place)
+
+        return count
+
+    def close(self):
+        '''
+        Close every sink, then every output, in order.
+        '''
+        for sink in self.sinks + self.outputs:
+            sink.close()
+
+
+# ----------------------------------------------------------------
+# Sinks.
+# ----------------------------------------------------------------
+
+
+class MarketSink(Sink):
+    '''
+    Collects the commodities of each market. markets is a list of (place,
+    commodities) in the order run.
+    '''
+
+    def __init__(self):
+        '''
+        Initialize
+        '''
+        self.markets = []
+        self._current = None
+
+    def start(self, place):
+        self._current = []
+
+    def add(self, commodity):
+        self._current.append(commodity)
+
+    def finish(self, place):
+        self.markets.append((place, self._current))
+        self._current = None
+
+
+class EDDNSink(Sink):
+    '''
+    Builds the EDDN commodity list of each market. markets maps places to
+    lists of EDDN commodity dicts.
+    '''
+
+    def __init__(self, levels):
+        '''
+        Initialize
+        '''
+        self.levels = levels
+        self.markets = {}
+        self._current = None
+
+    def start(self, place):
+        self._current = []
+
+    def add(self, commodity):
+        self._current.append(commodity.eddn(self.levels))
+
+    def finish(self, place):
+        self.markets[place] = self._current
+        self._current = None
+
+
+class ChangeSink(Sink):
+    '''
+    Finds the commodities whose prices changed. oldPrices(place) returns
+    the last known prices of a station as a dict of name to (sell, buy);
+    report(place, changes) is handed the PriceChange rows of each market.
+    '''
+
+    def __init__(self, oldPrices, report):
+        '''
+        Initialize
+        '''
+        self.oldPrices = oldPrices
+        self.report = report
+        self._old = None
+        self._changes = None
+
+    def start(self, place):
+        self._old = self.oldPrices(place)
+        self._changes = []
+
+    def add(self, commodity):
+        oldSell, oldBuy = self._old.get(commodity.name, (0, 0))
+        diffSell = commodity.sellPrice - oldSell
+        diffBuy = commodity.buyPrice - oldBuy
+        if diffSell or diffBuy:
+            self._changes.append(PriceChange(commodity, diffSell, diffBuy))
+
+    def finish(self, place):
+        self.report(place, self._changes)
+        self._old = self._changes = None
+
+
+class SnapshotSink(MarketSink):
+    '''
+    Records every market in an edapi_store.PriceSnapshots when closed.
+    '''
+
+    def __init__(self, snapshots):
+        '''
+        Initialize
+        '''
+        super().__init__()
+        self.snapshots = snapshots
+
+    def close(self):
+        self.snapshots.update(
+            (place.stationID, commodities)
+            for place, commodities in self.markets
+        )
+
+
+class HistorySink(MarketSink):
+    '''
+    Appends every market to an edapi_history.PriceHistory when closed.
+    '''
+
+    def __init__(self, history):
+        '''
+        Initialize
+        '''
+        super().__init__()
+        self.history = history
+
+    def close(self):
+        for place, commodities in self.markets:
+            self.history.append(
+                place.system,
+                place.station,
+                commodities,
+                place.timestamp,
+            )
+
+
+class CSVSink(Sink):
+    '''
+    Writes one CSV row per commodity to a file, or appends to it.
+    '''
+
+    fields = (
+        'timestamp',
+        'system',
+        'station',
+        'category',
+        'name',
+        'sellPrice',
+        'buyPrice',
+        'demand',
+        'demandBracket',
+        'stock',
+        'stockBracket',
+    )
+
+    def __init__(self, path):
+        '''
+        Initialize
+        '''
+        header = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.h = open(path, 'a', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.h)
+        if header:
+            self.writer.writerow(self.fields)
+        self._prefix = None
+
+    def start(self, place):
+        timestamp = place.timestamp
+        if timestamp is None:
+            timestamp = time.time()
+        self._prefix = (int(timestamp), place.system, place.station)
+
+    def add(self, c):
+        self.writer.writerow(self._prefix + (
+            c.category,
+            c.name,
+            c.sellPrice,
+            c.buyPrice,
+            c.demand,
+            c.demandBracket,
+            c.stock,
+            c.stockBracket,
+        ))
+
+    def close(self):
+        self.h.close()
+
+
+class JSONSink(Sink):
+    '''
+    Appends one JSON line per market to a file.
+    '''
+
+    def __init__(self, path):
+        '''
+        Initialize
+        '''
+        self.h = open(path, 'a', encoding='utf-8')
+        self._current = None
+
+    def start(self, place):
+        self._current = []
+
+    def add(self, commodity):
+        self._current.append(commodity._asdict())
+
+    def finish(self, place):
+        timestamp = place.timestamp
+        if timestamp is None:
+            timestamp = time.time()
+        self.h.write(json.dumps(
+            {
+                'timestamp': int(timestamp),
+                'system': place.system,
+                'station': place.station,
+                'commodities': self._current,
+            },
+            separators=(',', ':'),
+        ) + '\n')
+        self._current = None
+
+    def close(self):
+        self.h.close()
@@ -3,8 +3,6 @@
 # Elite Dangerous mobile API.
 # ----------------------------------------------------------------
 
-import cache
-import csvexport
 from datetime import datetime, timezone
 import getpass
 import hashlib
@@ -12,24 +10,40 @@ import json
 import os
 import pathlib
 import plugins
-import pickle
 import random
 import requests
 from requests.utils import dict_from_cookiejar
-from requests.utils import cookiejar_from_dict
 import sys
 import textwrap
 import time
 
+# The shared EDAPI modules are installed next to this plugin.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from edapi_archive import ProfileArchive  # NOQA
+from edapi_csv import CSVExporter  # NOQA
+from edapi_names import NameTable  # NOQA
+from edapi_stations import FIELDS, defaultProviders, resolveStation  # NOQA
+from edapi_stats import RequestStats  # NOQA
+from edapi_pipeline import EDDNSink, HistorySink, Pipeline  # NOQA
+from edapi_pipeline import SnapshotSink, placeOf  # NOQA
+from edapi_td import PricesTextSink, StationItemSink, syncShipVendor  # NOQA
+from edapi_td import cacheIsFresh, databasePath, ensureLoaded  # NOQA
+from edapi_td import saveCacheStamp, shipIDs  # NOQA
+from edapi_store import CookieStore, PriceSnapshots, ProfileCache  # NOQA
+from edapi_store import StationIndex, StationRow  # NOQA
+from edapi_transport import AUTH_CONFIRM, AUTH_LOGIN, AUTH_OK, authState  # NOQA
+from edapi_transport import Transport, TransportConfig  # NOQA
+
 __version_info__ = ('3', '6', '1')
 __version__ = '.'.join(__version_info__)
 
+# The station details the plugin keeps.
+PLUGIN_FIELDS = tuple(f for f in FIELDS if f != 'planetary')
+
 # ----------------------------------------------------------------
 # Deal with some differences in names between TD, ED and the API.
 # ----------------------------------------------------------------
 
-bracket_levels = ('-', 'L', 'M', 'H')
-
 # This translates what the API calls a ship into what TD calls a
 # ship.
 
@@ -103,42 +117,9 @@ eddn_ship_names = {
     'Vulture': 'Vulture',
 }
 
-# Categories to ignore. Drones end up here. No idea what they are.
-cat_ignore = [
-    'NonMarketable',
-]
-
-# TD has different names for these.
-cat_correct = {
-    'Narcotics': 'Legal Drugs',
-    'Slaves': 'Slavery',
-}
-
-# TD has different names for these.
-comm_correct = {
-    'Agricultural Medicines': 'Agri-Medicines',
-    'Atmospheric Extractors': 'Atmospheric Processors',
-    'Auto Fabricators': 'Auto-Fabricators',
-    'Basic Narcotics': 'Narcotics',
-    'Bio Reducing Lichen': 'Bioreducing Lichen',
-    'Hafnium178': 'Hafnium 178',
-    'Hazardous Environment Suits': 'H.E. Suits',
-    'Heliostatic Furnaces': 'Microbial Furnaces',
-    'Marine Supplies': 'Marine Equipment',
-    'META ALLOYS': 'Meta-Alloys',
-    'MU TOM IMAGER': 'Muon Imager',
-    'Non Lethal Weapons': 'Non-Lethal Weapons',
-    'S A P8 Core Container': 'SAP 8 Core Container',
-    'SKIMER COMPONENTS': 'Skimmer Components',
-    'Terrain Enrichment Systems': 'Land Enrichment Systems',
-    'U S S Cargo Ancient Artefact': 'Ancient Artefact',
-    'U S S Cargo Experimental Chemicals': 'Experimental Chemicals',
-    'U S S Cargo Military Plans': 'Military Plans',
-    'U S S Cargo Prototype Tech': 'Prototype Tech',
-    'U S S Cargo Rebel Transmissions': 'Rebel Transmissions',
-    'U S S Cargo Technical Blueprints': 'Technical Blueprints',
-    'U S S Cargo Trade Data': 'Trade Data',
-}
+# Category and commodity fixes, shared with edapi.py. Edit
+# edapi_names.json to change them.
+name_table = NameTable()
 
 modules = {
  128049250: {'category': 'standard',
@@ -3507,7 +3488,17 @@ class EDAPI:
     _cookiefile = _basename + '.cookies'
     _envfile = _basename + '.vars'
 
-    def __init__(self, basename='edapi', debug=False, cookiefile=None):
+    def __init__(
+        self,
+        basename='edapi',
+        debug=False,
+        cookiefile=None,
+        transport=None,
+        writeBehind=False,
+        fetch=True,
+        maxAge=0,
+        stats=None
+    ):
         '''
         Initialize
         '''
@@ -3522,37 +3513,61 @@ class EDAPI:
         self._envfile = self._basename + '.vars'
 
         self.debug = debug
+
+        # A profile reused from the cache, and when it was fetched. The
+        # timestamp of a new profile is None, for "now".
+        self.cached = False
+        self.timestamp = None
+
+        # Reuse the profile of a recent run if it is fresh enough.
+        self.profileCache = ProfileCache(self._cookiefile)
+        self.profile = None
+        if maxAge:
+            self.profile = self.profileCache.load(maxAge)
+            if self.profile is not None:
+                self.cached = True
+                self.timestamp = self.profileCache.timestamp
+                if self.debug:
+                    print('Using cached profile:', self.profileCache.path)
+                return
+
         # if self.debug:
         #     import http.client
         #     http.client.HTTPConnection.debuglevel = 3
 
         # Setup the HTTP session.
-        self.opener = requests.Session()
-
-        self.opener.headers = {
-            'User-Agent': self._agent
-        }
-
-        # Read/create the cookie jar.
-        if os.path.exists(self._cookiefile):
-            try:
-                with open(self._cookiefile, 'rb') as h:
-                    self.opener.cookies = cookiejar_from_dict(pickle.load(h))
-            except:
-                print('Unable to read cookie file.')
+        self.opener = Transport(
+            self._agent,
+            transport,
+            debug=self.debug,
+            stats=stats
+        )
 
-        else:
-            with open(self._cookiefile, 'wb') as h:
-                pickle.dump(dict_from_cookiejar(self.opener.cookies), h)
+        # Read the cookie jar.
+        self.cookies = CookieStore(self._cookiefile, writeBehind=writeBehind)
+        try:
+            self.opener.cookies = self.cookies.load()
+        except:
+            print('Unable to read cookie file.')
 
         # Grab the commander profile
+        if fetch:
+            self.profile = self.getProfile()
+
+    def getProfile(self):
+        '''
+        Fetch the commander /profile.
+        '''
         response = self._getURI('profile')
         try:
-            self.profile = response.json()
+            profile = response.json()
         except:
             sys.exit('Unable to parse JSON response for /profile!\
                      Try with --debug and report this.')
 
+        self.profileCache.store(profile)
+        return profile
+
     def _getBasicURI(self, uri, values=None):
         '''
         Perform a GET/POST to a URI
@@ -3563,20 +3578,23 @@ class EDAPI:
             if self.debug:
                 print('GET on: ', self._baseurl+uri)
                 print(dict_from_cookiejar(self.opener.cookies))
-            response = self.opener.get(self._baseurl+uri)
+            response = self.opener.get(self._baseurl+uri, label=uri)
         else:
             if self.debug:
                 print('POST on: ', self._baseurl+uri)
                 print(dict_from_cookiejar(self.opener.cookies))
-            response = self.opener.post(self._baseurl+uri, data=values)
+            response = self.opener.post(
+                self._baseurl+uri,
+                data=values,
+                label=uri
+            )
 
         if self.debug:
             print('Final URL:', response.url)
             print(dict_from_cookiejar(self.opener.cookies))
 
-        # Save the cookies.
-        with open(self._cookiefile, 'wb') as h:
-            pickle.dump(dict_from_cookiejar(self.opener.cookies), h)
+        # Save the cookies if they changed.
+        self.cookies.update(self.opener.cookies)
 
         # Return the response object.
         return response
@@ -3590,11 +3608,11 @@ class EDAPI:
         # login then ask again.
         response = self._getBasicURI(uri, values=values)
 
-        if str(response.url).endswith('user/login'):
+        if authState(response) != AUTH_OK:
             self._doLogin()
             response = self._getBasicURI(uri, values=values)
 
-        if str(response.url).endswith('user/login'):
+        if authState(response) != AUTH_OK:
             sys.exit(textwrap.fill(textwrap.dedent("""\
                 Something went terribly wrong. The login credentials
                 appear correct, but we are being denied access. Sometimes the
@@ -3647,11 +3665,12 @@ class EDAPI:
 
         # If we end up being redirected back to login,
         # the login failed.
-        if str(response.url).endswith('user/login'):
+        state = authState(response)
+        if state == AUTH_LOGIN:
             sys.exit('Login failed.')
 
         # Check to see if we need to do the auth token dance.
-        if str(response.url).endswith('user/confirm'):
+        if state == AUTH_CONFIRM:
             print()
             print("A verification code should have been sent to your "
                   "email address.")
@@ -3831,9 +3850,23 @@ class ImportPlugin(plugins.ImportPluginBase):
     pluginOptions = {
         'csvs': 'Merge shipyard into into ShipVendor.csv.',
         'eddn': 'Post market prices to EDDN.',
+        'timeout': 'Seconds to wait for the API to respond.',
+        'retries': 'Times to retry a failed request to the API.',
+        'async': 'Fetch from the API with the asyncio client (Python 3.7+).',
+        'maxage': 'Reuse a profile fetched at most this many seconds ago.',
+        'refresh': 'Ignore maxage and fetch a new profile.',
+        'archive': 'Append fetched profiles to this compressed archive.',
+        'history': 'Append imported prices to this price history.',
+        'stats': 'Print API request timings, or write them to stats=FILE.',
+        'textimport': 'Import prices through a .prices file parsed by TD.',
+        'stationinfo': 'Station details that override TD, from this file.',
+        'ask': 'Prompt for station details no other source knows.',
     }
 
     cookieFile = "edapi.cookies"
+    snapshotFile = "edapi.snapshots"
+    stampFile = "edapi.cachestamp"
+    indexFile = "edapi.stations"
 
     def __init__(self, tdb, tdenv):
         super().__init__(tdb, tdenv)
@@ -3842,12 +3875,77 @@ class ImportPlugin(plugins.ImportPluginBase):
         cookieFilePath = pathlib.Path(ImportPlugin.cookieFile)
         self.cookiePath = tdb.dataPath / cookieFilePath
 
+    def reportStats(self):
+        '''
+        Print the request timings, or write them as JSON to the file named
+        by the stats option.
+        '''
+        fname = self.getOption("stats")
+        if fname is True:
+            print(self.stats.report())
+        else:
+            with open(fname, 'w') as outfile:
+                outfile.write(self.stats.json())
+
+    def fileOption(self, name):
+        '''
+        The file named by an option, or None if it isn't set. "-O name"
+        without "=FILE" is an error, rather than a file called "True".
+        '''
+        fname = self.getOption(name)
+        if fname is True:
+            raise plugins.PluginException(
+                "The {0} option needs a file name: {0}=FILE.".format(name)
+            )
+        return fname or None
+
     def run(self):
         tdb, tdenv = self.tdb, self.tdenv
+        archive = self.fileOption("archive")
+        historyFile = self.fileOption("history")
 
         # Connect to the API, authenticate, and pull down the commander
         # /profile.
-        api = EDAPI(cookiefile=str(self.cookiePath))
+        transport = TransportConfig()
+        if self.getOption("timeout"):
+            transport.readTimeout = float(self.getOption("timeout"))
+        if self.getOption("retries"):
+            transport.retries = int(self.getOption("retries"))
+        maxAge = 0
+        if self.getOption("maxage") and not self.getOption("refresh"):
+            maxAge = int(self.getOption("maxage"))
+
+        # Request timings are kept on the plugin for callers to inspect.
+        self.stats = RequestStats()
+
+        useAsync = bool(self.getOption("async"))
+        if useAsync and sys.version_info < (3, 7):
+            raise plugins.PluginException(
+                "The async option needs Python 3.7 or newer."
+            )
+
+        api = EDAPI(
+            cookiefile=str(self.cookiePath),
+            transport=transport,
+            fetch=not useAsync,
+            maxAge=maxAge,
+            stats=self.stats
+        )
+        if useAsync and api.profile is None:
+            import edapi_async
+            client = edapi_async.AsyncEDAPI(api)
+            try:
+                api.profile = edapi_async.run(client.profile())
+            finally:
+                client.close()
+
+        # That was the last API request.
+        if self.getOption("stats"):
+            self.reportStats()
+
+        # Keep a copy of anything new.
+        if archive and not api.cached:
+            ProfileArchive(archive).append(api.profile)
 
         # Sanity check that the commander is docked. Otherwise we will get a
         # mismatch between the last system and last station.
@@ -3861,184 +3959,74 @@ class ImportPlugin(plugins.ImportPluginBase):
         place = '@{}/{}'.format(system.upper(), station)
         print(place)
 
-        # Reload the cache.
-        tdenv.DEBUG0("Checking the cache")
-        tdb.close()
-        tdb.reloadCache()
-        tdb.load(
-            maxSystemLinkLy=tdenv.maxSystemLinkLy,
-        )
-        tdb.close()
+        # Station.csv and ShipVendor.csv are brought up to date together.
+        exporter = CSVExporter(tdb, tdenv)
 
-        # Check to see if this system is in the Stations file
-        try:
-            station_lookup = tdb.lookupPlace(place)
-        except LookupError:
-            station_lookup = None
+        # Skip the cache check if nothing changed since the last run.
+        stampPath = tdb.dataPath / ImportPlugin.stampFile
+        if cacheIsFresh(tdb, stampPath):
+            tdenv.DEBUG0("The cache is current")
+        else:
+            tdenv.DEBUG0("Checking the cache")
+            tdb.close()
+            tdb.reloadCache()
+            tdb.close()
+
+        # Known stations are found in the index without loading TD.
+        index = StationIndex(tdb.dataPath / ImportPlugin.indexFile)
+        index.refresh(tdb.getDB(), databasePath(tdb))
+        station_lookup = index.lookup(system, station)
+        if station_lookup is None:
+            ensureLoaded(tdb, tdenv)
+
+            # Check to see if this system is in the Stations file
+            try:
+                station_lookup = tdb.lookupPlace(place)
+            except LookupError:
+                station_lookup = None
 
         print(station_lookup)
 
+        # Fill in what we can without asking. The plugin doesn't track
+        # planetary stations.
+        stationInfo = self.getOption("stationinfo")
+        info = resolveStation(
+            defaultProviders(
+                tdb.dataPath,
+                station_lookup,
+                overrides=stationInfo if stationInfo is not True else None,
+                ask=bool(self.getOption("ask")),
+            ),
+            system,
+            station,
+            api.profile,
+            fields=PLUGIN_FIELDS,
+        )
+
         # The station isn't known. Add it.
         if not station_lookup:
             print('Station unknown.')
             print('Adding:', place)
-            lsFromStar = input(
-                "Distance from star (enter for 0): "
-            ) or 0
-            try:
-                lsFromStar = int(float(lsFromStar))
-            except:
-                print("That doesn't seem to be a number. Defaulting to zero.")
-                lsFromStar = 0
-            blackMarket = input(
-                "Black market present (Y, N or enter for ?): "
-            ) or '?'
-            maxPadSize = input(
-                "Max pad size (S, M, L or enter for ?): "
-            ) or '?'
-            outfitting = input(
-                "Outfitting present (Y, N or enter for ?): "
-            ) or '?'
-            rearm = input(
-                "Rearm present (Y, N or enter for ?): "
-            ) or '?'
-            refuel = input(
-                "Refuel present (Y, N or enter for ?): "
-            ) or '?'
-            repair = input(
-                "Repair present (Y, N or enter for ?): "
-            ) or '?'
-            # This is unreliable, so ask the user.
-            if 'commodities' in api.profile['lastStarport']:
-                market = 'Y'
-            else:
-                market = input(
-                    "Commodity market present (Y, N or enter for ?): "
-                ) or '?'
-            # This is also unreliable, so ask the user.
-            if 'ships' in api.profile['lastStarport']:
-                shipyard = 'Y'
-            else:
-                shipyard = input(
-                    "Shipyard present (Y, N or enter for ?): "
-                ) or '?'
             system_lookup = tdb.lookupSystem(system)
-            if tdb.addLocalStation(
-                system=system_lookup,
-                name=station,
-                lsFromStar=lsFromStar,
-                blackMarket=blackMarket,
-                maxPadSize=maxPadSize,
-                market=market,
-                shipyard=shipyard,
-                outfitting=outfitting,
-                rearm=rearm,
-                refuel=refuel,
-                repair=repair
-            ):
-                lines, csvPath = csvexport.exportTableToFile(
-                    tdb,
-                    tdenv,
-                    "Station"
-                )
-                tdenv.NOTE("{} updated.", csvPath)
+            if tdb.addLocalStation(system=system_lookup, name=station, **info):
                 station_lookup = tdb.lookupPlace(place)
+                exporter.mark("Station", station_lookup.ID)
+                index.refreshStation(tdb.getDB(), station_lookup.ID)
             station_lookup = tdb.lookupStation(station, system)
         else:
             # See if we need to update the info for this station.
-            lsFromStar = station_lookup.lsFromStar
-            blackMarket = station_lookup.blackMarket
-            maxPadSize = station_lookup.maxPadSize
-            market = station_lookup.market
-            shipyard = station_lookup.shipyard
-            outfitting = station_lookup.outfitting
-            rearm = station_lookup.rearm
-            refuel = station_lookup.refuel
-            repair = station_lookup.repair
-
-            if lsFromStar == 0:
-                lsFromStar = input(
-                    "Update distance from star (enter for 0): "
-                ) or 0
-                lsFromStar = int(lsFromStar)
-
-            if blackMarket is '?':
-                blackMarket = input(
-                    "Update black market present (Y, N or enter for ?): "
-                ) or '?'
-
-            if maxPadSize is '?':
-                maxPadSize = input(
-                    "Update max pad size (S, M, L or enter for ?): "
-                ) or '?'
-
-            if outfitting is '?':
-                outfitting = input(
-                    "Update outfitting present (Y, N or enter for ?): "
-                ) or '?'
-
-            if rearm is '?':
-                rearm = input(
-                    "Update rearm present (Y, N or enter for ?): "
-                ) or '?'
-
-            if refuel is '?':
-                refuel = input(
-                    "Update refuel present (Y, N or enter for ?): "
-                ) or '?'
-
-            if repair is '?':
-                repair = input(
-                    "Update repair present (Y, N or enter for ?): "
-                ) or '?'
-
-            # This is unreliable, so ask the user if unknown.
-            if 'commodities' in api.profile['lastStarport']:
-                market = 'Y'
-            else:
-                if market is '?':
-                    market = input(
-                        "Commodity market present (Y, N or enter for ?): "
-                    ) or '?'
-
-            # This is also unreliable, so ask the user if unknown.
-            if 'ships' in api.profile['lastStarport']:
-                shipyard = 'Y'
-            else:
-                if shipyard is '?':
-                    shipyard = input(
-                        "Shipyard present (Y, N or enter for ?): "
-                    ) or '?'
-
-            if (
-                lsFromStar != station_lookup.lsFromStar or
-                blackMarket != station_lookup.blackMarket or
-                maxPadSize != station_lookup.maxPadSize or
-                market != station_lookup.market or
-                shipyard != station_lookup.shipyard or
-                outfitting != station_lookup.outfitting or
-                rearm != station_lookup.rearm or
-                refuel != station_lookup.refuel or
-                repair != station_lookup.repair
+            if any(
+                info[field] != getattr(station_lookup, field)
+                for field in info
             ):
-                if tdb.updateLocalStation(
-                    station=station_lookup,
-                    lsFromStar=lsFromStar,
-                    blackMarket=blackMarket,
-                    maxPadSize=maxPadSize,
-                    market=market,
-                    shipyard=shipyard,
-                    outfitting=outfitting,
-                    rearm=rearm,
-                    refuel=refuel,
-                    repair=repair
-                ):
-                    lines, csvPath = csvexport.exportTableToFile(
-                        tdb,
-                        tdenv,
-                        "Station",
-                    )
-                    tdenv.NOTE("{} updated.", csvPath)
+                # TD updates its own station objects.
+                if isinstance(station_lookup, StationRow):
+                    ensureLoaded(tdb, tdenv)
+                    station_lookup = tdb.lookupPlace(place)
+                if tdb.updateLocalStation(station=station_lookup, **info):
+                    exporter.mark("Station", station_lookup.ID)
+                    index.refreshStation(tdb.getDB(), station_lookup.ID)
+        index.close()
 
         # If a shipyard exists, update the ship vendor list.
         eddn_ships = []
@@ -4053,25 +4041,31 @@ class ImportPlugin(plugins.ImportPluginBase):
                     eddn_ships.append(eddn_ship_names[ship])
 
             if self.getOption("csvs"):
-                db = tdb.getDB()
-                for ship in ships:
-                    ship_lookup = tdb.lookupShip(ship_names[ship])
-                    db.execute(
-                        """
-                        REPLACE INTO ShipVendor
-                        (ship_id, station_id)
-                        VALUES
-                        (?, ?)
-                        """,
-                        [ship_lookup.ID, station_lookup.ID]
-                    )
-                    db.commit()
-                tdenv.NOTE("Updated {} ships in {} shipyard.", len(ships), place)
-                lines, csvPath = csvexport.exportTableToFile(
-                    tdb,
-                    tdenv,
-                    "ShipVendor",
+                known = shipIDs(tdb.getDB())
+
+                def shipID(name):
+                    try:
+                        return known[name.upper()]
+                    except KeyError:
+                        raise LookupError('Unknown ship: ' + name)
+
+                added, removed = syncShipVendor(
+                    tdb.getDB(),
+                    station_lookup.ID,
+                    [shipID(ship_names[ship]) for ship in ships],
                 )
+                if added or removed:
+                    tdenv.NOTE(
+                        "Added {} and removed {} ships in {} shipyard.",
+                        len(added),
+                        len(removed),
+                        place,
+                    )
+                    exporter.mark("ShipVendor", station_lookup.ID)
+                else:
+                    tdenv.NOTE("{} shipyard unchanged.", place)
+
+        exporter.flush()
 
         # Some sanity checking on the market.
         if 'commodities' not in api.profile['lastStarport']:
@@ -4084,85 +4078,53 @@ class ImportPlugin(plugins.ImportPluginBase):
             )
             return False
 
-        # Create the import file.
-        with open(self.filename, 'w', encoding="utf-8") as f:
-            f.write("@ {}/{}\n".format(system, station))
-            eddn_market = []
-            for commodity in api.profile['lastStarport']['commodities']:
-                if commodity['categoryname'] in cat_ignore:
-                    continue
-                if commodity['categoryname'] in cat_correct:
-                    commodity['categoryname'] = cat_correct[commodity['categoryname']]  # NOQA
-                if commodity['name'] in comm_correct:
-                    commodity['name'] = comm_correct[commodity['name']]
-
-                def commodity_int(key):
-                    try:
-                        commodity[key] = int(commodity[key])
-                    except (ValueError, KeyError):
-                        commodity[key] = 0
-
-                commodity_int('stock')
-                commodity_int('demand')
-                commodity_int('demandBracket')
-                commodity_int('stockBracket')
-                commodity_int('buyPrice')
-                commodity_int('sellPrice')
-
-                # Populate EDDN
-                if self.getOption("eddn"):
-                    eddn_market.append(
-                        {
-                            "name": commodity['name'],
-                            "buyPrice": commodity['buyPrice'],
-                            "supply": commodity['stock'],
-                            "supplyLevel": EDDN._levels[commodity['stockBracket']],  # NOQA
-                            "sellPrice": commodity['sellPrice'],
-                            "demand": commodity['demand'],
-                            "demandLevel": EDDN._levels[commodity['demandBracket']]  # NOQA
-                        }
-                    )
+        tdenv.ignoreUnknown = True
 
-                f.write(
-                    "\t+ {}\n".format(
-                        commodity['categoryname']
-                    )
-                )
+        if self.getOption("textimport"):
+            prices = PricesTextSink(tdb, tdenv)
+        else:
+            prices = StationItemSink(tdb, tdenv, ignoreUnknown=True)
 
-                # If stock is zero, list it as unavailable.
-                # If the stockBracket is zero, ignore any stock.
-                if not commodity['stock'] or not commodity['stockBracket']:
-                    commodity['stock'] = '-'
-                else:
-                    demand = bracket_levels[commodity['stockBracket']]
-                    commodity['stock'] = str(commodity['stock'])+demand
+        # Keep the prices for edapi.py to show changes against.
+        snapshots = PriceSnapshots(
+            tdb.dataPath / ImportPlugin.snapshotFile,
+            databasePath(tdb),
+        )
 
-                # If demand is zero, list as unknown.
-                if not (commodity['demand'] and commodity['demandBracket']):
-                    commodity['demand'] = '?'
-                else:
-                    demand = bracket_levels[commodity['demandBracket']]
-                    commodity['demand'] = str(commodity['demand'])+demand
+        eddnSink = None
+        if self.getOption("eddn"):
+            eddnSink = EDDNSink(EDDN._levels)
 
-                f.write(
-                    "\t\t{} {} {} {} {}\n".format(
-                        commodity['name'],
-                        commodity['sellPrice'],
-                        commodity['buyPrice'],
-                        commodity['demand'],
-                        commodity['stock'],
-                    ))
+        history = None
+        if historyFile:
+            from edapi_history import PriceHistory
+            history = HistorySink(PriceHistory(historyFile))
 
-        tdenv.ignoreUnknown = True
+        pipeline = Pipeline(
+            name_table,
+            (prices, SnapshotSink(snapshots)),
+            (history, eddnSink),
+        )
 
-        cache.importDataFromFile(
-            tdb,
-            tdenv,
-            pathlib.Path(self.filename),
+        # A profile reused from the cache keeps the time it was fetched,
+        # and went to the history and the EDDN in the run that fetched it.
+        place = placeOf(api.profile, station_lookup.ID, api.timestamp)
+        pipeline.run(
+            place,
+            api.profile['lastStarport']['commodities'],
+            outputs=not api.cached,
         )
+        pipeline.close()
+        snapshots.close()
+
+        # Everything TD reads is written. The next run can skip the reload
+        # unless something else changes it.
+        saveCacheStamp(tdb, stampPath)
 
         # Import EDDN
-        if self.getOption("eddn"):
+        if self.getOption("eddn") and api.cached:
+            print('Profile reused from the cache. Not posting to EDDN.')
+        elif self.getOption("eddn"):
             print('Posting prices to EDDN...')
             con = EDDN(
                 api.profile['commander']['name'],
@@ -4173,7 +4135,7 @@ class ImportPlugin(plugins.ImportPluginBase):
             con.publishCommodities(
                 system,
                 station,
-                eddn_market
+                eddnSink.markets[place]
             )
             if (eddn_ships):
                 print('Posting shipyard to EDDN...')
@@ -0,0 +1,214 @@
+# ----------------------------------------------------------------
+# Station details without prompting.
+#
+# Each detail TD keeps about a station (distance, pad size, black
+# market, services) is taken from the first source that knows it:
+# a local override file, what the profile shows, the values already
+# in TD from earlier runs, and optionally the user. Anything
+# still unknown stays unknown ('?', or 0 for the distance), so
+# batch and unattended runs never stop for input.
+# ----------------------------------------------------------------
+
+import json
+import os
+
+# The override file format this module reads.
+OVERRIDES_VERSION = 1
+
+# The override file looked for in the TD data directory.
+OVERRIDES_FILE = 'edapi_stations.json'
+
+# Station details, by TD attribute name, with their unknown value.
+UNKNOWN = {
+    'lsFromStar': 0,
+    'blackMarket': '?',
+    'maxPadSize': '?',
+    'market': '?',
+    'shipyard': '?',
+    'outfitting': '?',
+    'rearm': '?',
+    'refuel': '?',
+    'repair': '?',
+    'planetary': '?',
+}
+FIELDS = tuple(UNKNOWN)
+
+# What the user is asked for each detail with --ask.
+PROMPTS = {
+    'lsFromStar': "Distance from star (enter for 0): ",
+    'blackMarket': "Black market present (Y, N or enter for ?): ",
+    'maxPadSize': "Max pad size (S, M, L or enter for ?): ",
+    'market': "Commodity market present (Y, N or enter for ?): ",
+    'shipyard': "Shipyard present (Y, N or enter for ?): ",
+    'outfitting': "Outfitting present (Y, N or enter for ?): ",
+    'rearm': "Rearm present (Y, N or enter for ?): ",
+    'refuel': "Refuel present (Y, N or enter for ?): ",
+    'repair': "Repair present (Y, N or enter for ?): ",
+    'planetary': "Planetary Station (Y, N or enter for ?): ",
+}
+
+_choices = {
+    'maxPadSize': ('S', 'M', 'L'),
+}
+
+
+def known(field, value):
+    '''
+    True if value is a real value for field rather than "unknown".
+    '''
+    if value is None or value == UNKNOWN[field]:
+        return False
+    if field == 'lsFromStar':
+        return True
+    return value in _choices.get(field, ('Y', 'N'))
+
+
+def _clean(field, value):
+    # Values typed by people: "y", " 1234.5 ".
+    if field == 'lsFromStar':
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return None
+    if isinstance(value, str):
+        return value.strip().upper()
+    return None
+
+
+class OverrideProvider:
+    '''
+    Station details from a JSON file, for stations the other sources get
+    wrong or can't know:
+
+    {"version": 1, "stations": {"LAVE/LAVE STATION": {"maxPadSize": "L"}}}
+
+    Station keys are "System/Station" and ignore case.
+    '''
+
+    def __init__(self, path):
+        '''
+        Initialize
+        '''
+        self.path = str(path)
+        self.stations = {}
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as h:
+            data = json.load(h)
+        if data.get('version') != OVERRIDES_VERSION:
+            raise ValueError(
+                '{}: unsupported version {!r}, expected {}.'.format(
+                    self.path,
+                    data.get('version'),
+                    OVERRIDES_VERSION,
+                )
+            )
+        for key, values in data.get('stations', {}).items():
+            self.stations[key.upper()] = values
+
+    def values(self, system, station, profile):
+        values = self.stations.get('{}/{}'.format(system, station).upper())
+        if not values:
+            return {}
+        return {
+            field: _clean(field, value)
+            for field, value in values.items()
+            if field in UNKNOWN
+        }
+
+
+class CachedProvider:
+    '''
+    The details TD already has for a station, from earlier runs or its
+    own data. station is a TD station or a StationRow, or None.
+    '''
+
+    def __init__(self, station):
+        '''
+        Initialize
+        '''
+        self.station = station
+
+    def values(self, system, station, profile):
+        if self.station is None:
+            return {}
+        return {
+            field: getattr(self.station, field, None) for field in FIELDS
+        }
+
+
+class ProfileProvider:
+    '''
+    What the profile shows. The API leaves out services now and then, so
+    only their presence counts. A service it shows is current, so this
+    goes before CachedProvider.
+    '''
+
+    def values(self, system, station, profile):
+        starport = profile['lastStarport']
+        values = {}
+        if 'commodities' in starport:
+            values['market'] = 'Y'
+        if 'ships' in starport:
+            values['shipyard'] = 'Y'
+        if starport.get('modules'):
+            values['outfitting'] = 'Y'
+        return values
+
+
+class PromptProvider:
+    '''
+    Asks the user for the details nothing else knows. Only used when
+    asking is enabled.
+    '''
+
+    def values(self, system, station, profile, fields=FIELDS):
+        values = {}
+        for field in fields:
+            answer = input(PROMPTS[field])
+            if answer:
+                values[field] = _clean(field, answer)
+        return values
+
+
+def defaultProviders(dataPath, station=None, overrides=None, ask=False):
+    '''
+    The usual provider chain: the override file (overrides, or
+    edapi_stations.json in dataPath), the profile, the TD station and, if
+    ask is set, the user.
+    '''
+    if overrides is None:
+        overrides = os.path.join(str(dataPath), OVERRIDES_FILE)
+    providers = [
+        OverrideProvider(overrides),
+        ProfileProvider(),
+        CachedProvider(station),
+    ]
+    if ask:
+        providers.append(PromptProvider())
+    return providers
+
+
+def resolveStation(providers, system, station, profile, fields=FIELDS):
+    '''
+    The details of a station as a dict of field to value, each from the
+    first provider that knows it, or unknown.
+    '''
+    resolved = {}
+    missing = list(fields)
+    for provider in providers:
+        if not missing:
+            break
+        if isinstance(provider, PromptProvider):
+            print('Unknown details of {}/{}:'.format(system, station))
+            values = provider.values(system, station, profile, missing)
+        else:
+            values = provider.values(system, station, profile)
+        for field in list(missing):
+            if known(field, values.get(field)):
+                resolved[field] = values[field]
+                missing.remove(field)
+
+    for field in missing:
+        resolved[field] = UNKNOWN[field]
+    return resolved
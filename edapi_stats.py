@@ -0,0 +1,114 @@
+# ----------------------------------------------------------------
+# Request timing statistics for the companion API client.
+# ----------------------------------------------------------------
+
+import json
+import math
+import time
+
+
+def percentile(values, pct):
+    '''
+    Nearest rank percentile of a sorted list.
+    '''
+    if not values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(values)))
+    return values[rank - 1]
+
+
+class RequestStats:
+    '''
+    Collects transport attempts and summarizes their timings per URI.
+    '''
+
+    # Timings reported, as attributes of edapi_transport.Attempt.
+    fields = ('dns', 'connect', 'ttfb', 'elapsed')
+    percentiles = (50, 90, 99, 100)
+
+    def __init__(self):
+        '''
+        Initialize
+        '''
+        self.attempts = []
+        self.started = time.perf_counter()
+
+    def add(self, attempt):
+        self.attempts.append(attempt)
+
+    def summary(self):
+        '''
+        A dict of per URI statistics, plus the overall network and wall
+        clock times.
+        '''
+        byLabel = {}
+        for attempt in self.attempts:
+            byLabel.setdefault(attempt.label, []).append(attempt)
+
+        uris = {}
+        for label, attempts in sorted(byLabel.items()):
+            entry = {
+                'count': len(attempts),
+                'errors': sum(
+                    1 for a in attempts
+                    if a.error or (a.status and a.status >= 500)
+                ),
+                'newConnections': sum(
+                    1 for a in attempts if a.connect is not None
+                ),
+                'bytes': sum(a.bytes for a in attempts),
+            }
+            for field in self.fields:
+                values = sorted(
+                    getattr(a, field) for a in attempts
+                    if getattr(a, field) is not None
+                )
+                entry[field] = {
+                    'p{}'.format(p): percentile(values, p)
+                    for p in self.percentiles
+                }
+            uris[label] = entry
+
+        return {
+            'uris': uris,
+            'network': sum(a.elapsed for a in self.attempts),
+            'wall': time.perf_counter() - self.started,
+        }
+
+    def json(self):
+        return json.dumps(self.summary(), indent=4, sort_keys=True)
+
+    def report(self):
+        '''
+        A printable table of the summary. Times are in milliseconds.
+        '''
+        summary = self.summary()
+
+        def ms(value):
+            return '-' if value is None else '{:.0f}'.format(value * 1000)
+
+        lines = [
+            "{:<16} {:>3} {:>8} {:>15} {:>15} {:>15} {:>15}".format(
+                'URI', '#', 'Bytes', 'DNS p50/p90', 'Connect p50/p90',
+                'TTFB p50/p90', 'Total p50/p90',
+            )
+        ]
+        for label, entry in summary['uris'].items():
+            lines.append(
+                "{:<16} {:>3} {:>8} {:>15} {:>15} {:>15} {:>15}".format(
+                    '/' + label,
+                    entry['count'],
+                    entry['bytes'],
+                    *(
+                        ms(entry[f]['p50']) + '/' + ms(entry[f]['p90'])
+                        for f in self.fields
+                    )
+                )
+            )
+        lines.append(
+            'Network {:.3f}s of {:.3f}s wall clock.'.format(
+                summary['network'],
+                summary['wall'],
+            )
+        )
+        return '\n'.join(lines)
@@ -0,0 +1,488 @@
+# ----------------------------------------------------------------
+# Local files kept by EDAPI between runs.
+# ----------------------------------------------------------------
+
+import atexit
+import collections
+import hashlib
+import json
+import os
+import pickle
+from requests.utils import dict_from_cookiejar
+from requests.utils import cookiejar_from_dict
+import sqlite3
+import tempfile
+import time
+
+
+def atomicWrite(path, data):
+    '''
+    Replace the contents of path with data (bytes) in one step.
+
+    The data goes to a temp file in the same directory which is then
+    renamed over the target, so readers never see a partial file.
+    '''
+    path = str(path)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmpname = tempfile.mkstemp(
+        dir=directory,
+        prefix='.' + os.path.basename(path) + '.',
+        suffix='.tmp',
+    )
+    try:
+        with os.fdopen(fd, 'wb') as h:
+            h.write(data)
+        os.replace(tmpname, path)
+    except:
+        os.unlink(tmpname)
+        raise
+
+
+class CookieStore:
+    '''
+    Persists a session cookie jar, only touching the disk when a cookie
+    actually changed.
+    '''
+
+    def __init__(self, path, writeBehind=False):
+        '''
+        Initialize
+
+        With writeBehind set, changes are only written out by flush(),
+        which is also registered to run at exit.
+        '''
+        self.path = str(path)
+        self.writeBehind = writeBehind
+        self.writes = 0
+
+        # What is on disk, and what should be.
+        self._saved = None
+        self._pending = None
+        self._registered = False
+
+    def load(self):
+        '''
+        Read the cookie jar from disk. Returns an empty jar if there is no
+        cookie file yet.
+        '''
+        if not os.path.exists(self.path):
+            return cookiejar_from_dict({})
+
+        with open(self.path, 'rb') as h:
+            cookies = pickle.load(h)
+        self._saved = dict(cookies)
+        return cookiejar_from_dict(cookies)
+
+    @property
+    def dirty(self):
+        return self._pending is not None
+
+    def update(self, jar):
+        '''
+        Note the current state of the jar, writing it if it changed.
+        '''
+        cookies = dict_from_cookiejar(jar)
+        if cookies == self._saved:
+            self._pending = None
+            return False
+
+        self._pending = cookies
+        if not self.writeBehind:
+            self.flush()
+        elif not self._registered:
+            atexit.register(self.flush)
+            self._registered = True
+        return True
+
+    def flush(self):
+        '''
+        Write any pending change to disk.
+        '''
+        if self._pending is None:
+            return False
+
+        atomicWrite(self.path, pickle.dumps(self._pending))
+        self._saved, self._pending = self._pending, None
+        self.writes += 1
+        return True
+
+
+class ProfileCache:
+    '''
+    The last /profile response fetched with a given cookie file, so runs
+    shortly after one another can skip the API.
+    '''
+
+    def __init__(self, cookiefile):
+        '''
+        Initialize
+        '''
+        self.path = os.path.splitext(str(cookiefile))[0] + '.profile'
+        self.age = None
+
+        # When the loaded profile was fetched, in seconds since the epoch.
+        self.timestamp = None
+
+    def load(self, maxAge):
+        '''
+        Return the cached profile if it is at most maxAge seconds old,
+        otherwise None.
+        '''
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return None
+        self.age = time.time() - mtime
+
+        if self.age > maxAge:
+            return None
+
+        try:
+            with open(self.path, 'rb') as h:
+                profile = json.loads(h.read().decode('utf-8'))
+        except ValueError:
+            return None
+        self.timestamp = int(mtime)
+        return profile
+
+    def store(self, profile):
+        '''
+        Replace the cached profile.
+        '''
+        atomicWrite(self.path, json.dumps(profile).encode('utf-8'))
+
+
+class PriceSnapshots:
+    '''
+    The last market imported for each station, keyed by TD station ID, so
+    price changes can be shown without querying TD by station name.
+
+    Station IDs only mean something in the TD database they came from, at
+    dbPath. The snapshots are dropped when that database is replaced, as
+    a rebuild may number the stations differently.
+    '''
+
+    def __init__(self, path, dbPath):
+        '''
+        Initialize
+        '''
+        self.path = str(path)
+        self.db = sqlite3.connect(self.path)
+        with self.db:
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS Source (
+                    name TEXT PRIMARY KEY,
+                    value
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS Snapshot (
+                    station_id INTEGER PRIMARY KEY,
+                    modified INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS SnapshotItem (
+                    station_id INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    sell INTEGER NOT NULL,
+                    buy INTEGER NOT NULL,
+                    demand INTEGER NOT NULL,
+                    demand_bracket INTEGER NOT NULL,
+                    stock INTEGER NOT NULL,
+                    stock_bracket INTEGER NOT NULL,
+                    PRIMARY KEY (station_id, name)
+                ) WITHOUT ROWID;
+            """)
+        self._checkSource(dbPath)
+
+    def _checkSource(self, dbPath):
+        # Edits keep the database file; a rebuild writes a new one.
+        inode = os.stat(str(dbPath)).st_ino
+        source = dict(self.db.execute('SELECT name, value FROM Source'))
+        if source.get('inode') == inode:
+            return
+
+        with self.db:
+            self.db.execute('DELETE FROM SnapshotItem')
+            self.db.execute('DELETE FROM Snapshot')
+            self.db.execute(
+                'INSERT OR REPLACE INTO Source VALUES (?, ?)',
+                ('inode', inode),
+            )
+
+    def prices(self, stationID):
+        '''
+        A dict of name to (sell, buy) for a station, or None if there is no
+        snapshot of it.
+        '''
+        known = self.db.execute(
+            'SELECT 1 FROM Snapshot WHERE station_id = ?',
+            (stationID,),
+        ).fetchone()
+        if known is None:
+            return None
+
+        return {
+            name: (sell, buy)
+            for name, sell, buy in self.db.execute(
+                """
+                SELECT name, sell, buy
+                FROM SnapshotItem
+                WHERE station_id = ?
+                """,
+                (stationID,),
+            )
+        }
+
+    def update(self, markets, timestamp=None):
+        '''
+        Replace the snapshots of every (station ID, commodities) in markets,
+        where commodities is any iterable of Commodity records, all in one
+        transaction.
+        '''
+        if timestamp is None:
+            timestamp = time.time()
+
+        stations = []
+        rows = []
+        for stationID, market in markets:
+            stations.append((stationID, int(timestamp)))
+            rows.extend(
+                (
+                    stationID,
+                    c.name,
+                    c.sellPrice,
+                    c.buyPrice,
+                    c.demand,
+                    c.demandBracket,
+                    c.stock,
+                    c.stockBracket,
+                )
+                for c in market
+            )
+
+        with self.db:
+            self.db.executemany(
+                'DELETE FROM SnapshotItem WHERE station_id = ?',
+                [(stationID,) for stationID, _ in stations],
+            )
+            self.db.executemany(
+                'INSERT OR REPLACE INTO Snapshot VALUES (?, ?)',
+                stations,
+            )
+            self.db.executemany(
+                'INSERT OR REPLACE INTO SnapshotItem VALUES '
+                '(?, ?, ?, ?, ?, ?, ?, ?)',
+                rows,
+            )
+
+    def close(self):
+        self.db.close()
+
+
+# A station as the index knows it. The attribute names match TD's
+# Station objects, so either can be compared and updated.
+StationRow = collections.namedtuple('StationRow', (
+    'ID',
+    'system',
+    'dbname',
+    'lsFromStar',
+    'blackMarket',
+    'maxPadSize',
+    'market',
+    'shipyard',
+    'outfitting',
+    'rearm',
+    'refuel',
+    'repair',
+    'planetary',
+))
+
+# StationRow fields after the names, as TD Station columns.
+_stationColumns = (
+    'ls_from_star',
+    'blackmarket',
+    'max_pad_size',
+    'market',
+    'shipyard',
+    'outfitting',
+    'rearm',
+    'refuel',
+    'repair',
+    'planetary',
+)
+
+
+# Names the stationKey() scheme. Indexes keyed otherwise are rebuilt.
+STATION_KEYS = 'sha1'
+
+
+def stationKey(system, station):
+    '''
+    The index key of a station: a 64 bit hash of the upper case names.
+    '''
+    digest = hashlib.sha1(
+        '{}\0{}'.format(system.upper(), station.upper()).encode('utf-8'),
+    ).digest()[:8]
+    return int.from_bytes(digest, 'little', signed=True)
+
+
+class StationIndex:
+    '''
+    The TD stations by (system, station) name, with the details edapi
+    checks, in a small SQLite file. Lookups don't need a loaded TradeDB.
+    refresh() brings it up to date from the TD database, reading only the
+    stations added or modified since the last refresh.
+    '''
+
+    def __init__(self, path):
+        '''
+        Initialize
+        '''
+        self.path = str(path)
+        self.db = sqlite3.connect(self.path)
+        with self.db:
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS Station (
+                    key INTEGER PRIMARY KEY,
+                    station_id INTEGER NOT NULL,
+                    system TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    ls_from_star,
+                    blackmarket,
+                    max_pad_size,
+                    market,
+                    shipyard,
+                    outfitting,
+                    rearm,
+                    refuel,
+                    repair,
+                    planetary
+                );
+                CREATE INDEX IF NOT EXISTS StationID ON Station (station_id);
+                CREATE TABLE IF NOT EXISTS Source (
+                    name TEXT PRIMARY KEY,
+                    value
+                ) WITHOUT ROWID;
+            """)
+
+    def lookup(self, system, station):
+        '''
+        The StationRow of station in system, ignoring case, or None.
+        '''
+        row = self.db.execute(
+            'SELECT station_id, system, name, {} FROM Station WHERE key = ?'
+            .format(', '.join(_stationColumns)),
+            (stationKey(system, station),),
+        ).fetchone()
+        if row is None:
+            return None
+        row = StationRow(*row)
+        if (
+            row.system.upper() != system.upper() or
+            row.dbname.upper() != station.upper()
+        ):
+            return None
+        return row
+
+    def _select(self, tddb, where='', params=()):
+        # Older TD databases lack some columns.
+        have = {r[1] for r in tddb.execute('PRAGMA table_info(Station)')}
+        return tddb.execute(
+            """
+            SELECT st.station_id, sy.name, st.name, {}
+            FROM Station st JOIN System sy ON sy.system_id = st.system_id
+            {}
+            """.format(
+                ', '.join(
+                    'st.' + c if c in have else 'NULL'
+                    for c in _stationColumns
+                ),
+                where,
+            ),
+            params,
+        ).fetchall()
+
+    def _store(self, rows):
+        self.db.executemany(
+            'DELETE FROM Station WHERE station_id = ?',
+            [(row[0],) for row in rows],
+        )
+        self.db.executemany(
+            'INSERT OR REPLACE INTO Station VALUES ({})'.format(
+                ', '.join('?' * (len(_stationColumns) + 4))
+            ),
+            [(stationKey(row[1], row[2]),) + tuple(row) for row in rows],
+        )
+
+    def _source(self):
+        return dict(self.db.execute('SELECT name, value FROM Source'))
+
+    def refresh(self, tddb, dbPath):
+        '''
+        Bring the index up to date with the TD database tddb, stored at
+        dbPath. Returns the number of stations read.
+        '''
+        st = os.stat(str(dbPath))
+        stamp = '{}:{}:{}'.format(st.st_ino, st.st_mtime_ns, st.st_size)
+        source = self._source()
+        if (
+            source.get('stamp') == stamp and
+            source.get('keys') == STATION_KEYS
+        ):
+            return 0
+
+        (modified,), = tddb.execute(
+            "SELECT COALESCE(MAX(modified), '') FROM Station"
+        )
+        (lastID,), = tddb.execute(
+            'SELECT COALESCE(MAX(station_id), 0) FROM Station'
+        )
+        (count,), = tddb.execute('SELECT COUNT(*) FROM Station')
+
+        with self.db:
+            rows = None
+            if (
+                source.get('inode') == st.st_ino and
+                source.get('keys') == STATION_KEYS
+            ):
+                # Same database: only new and modified stations.
+                rows = self._select(
+                    tddb,
+                    "WHERE st.station_id > ? OR "
+                    "COALESCE(st.modified, '') >= ?",
+                    (source.get('lastID', 0), source.get('modified', '')),
+                )
+                self._store(rows)
+                (indexed,), = self.db.execute('SELECT COUNT(*) FROM Station')
+                if indexed != count:
+                    # Stations were removed.
+                    rows = None
+            if rows is None:
+                # A rebuilt database, or a first run: read it all.
+                self.db.execute('DELETE FROM Station')
+                rows = self._select(tddb)
+                self._store(rows)
+            self.db.executemany(
+                'INSERT OR REPLACE INTO Source VALUES (?, ?)',
+                (
+                    ('stamp', stamp),
+                    ('inode', st.st_ino),
+                    ('modified', modified),
+                    ('lastID', lastID),
+                    ('keys', STATION_KEYS),
+                ),
+            )
+
+        return len(rows)
+
+    def refreshStation(self, tddb, stationID):
+        '''
+        Re-read one station after edapi changed it.
+        '''
+        with self.db:
+            self._store(self._select(
+                tddb,
+                'WHERE st.station_id = ?',
+                (stationID,),
+            ))
+
+    def close(self):
+        self.db.close()
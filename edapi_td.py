@@ -0,0 +1,403 @@
+# ----------------------------------------------------------------
+# Direct Trade Dangerous database updates.
+#
+# Writes normalized markets straight into the StationItem table
+# instead of going through a .prices file that TD has to parse
+# back. Follows TD's import rules: a station's items are replaced
+# as a whole and unknown demand or supply is stored as -1 or 0.
+# The text import through an in-memory .prices file is kept as a
+# fallback.
+# ----------------------------------------------------------------
+
+import contextlib
+import io
+import json
+import os
+from pathlib import Path
+import tempfile
+import time
+
+from edapi_market import groupLines
+from edapi_pipeline import Sink
+
+
+def itemIDs(db):
+    '''
+    TD item IDs keyed by upper case item name.
+    '''
+    return {
+        name.upper(): itemID
+        for itemID, name in db.execute('SELECT item_id, name FROM Item')
+    }
+
+
+def itemOrder(db):
+    '''
+    TD item ui_order keyed by upper case item name.
+    '''
+    return {
+        name.upper(): order
+        for name, order in db.execute('SELECT name, ui_order FROM Item')
+    }
+
+
+def shipIDs(db):
+    '''
+    TD ship IDs keyed by upper case ship name.
+    '''
+    return {
+        name.upper(): shipID
+        for shipID, name in db.execute('SELECT ship_id, name FROM Ship')
+    }
+
+
+def databasePath(tdb):
+    '''
+    The Path of the TD database file.
+    '''
+    dbPath = getattr(tdb, 'dbPath', None)
+    if dbPath is None:
+        dbPath = Path(str(tdb.dataPath)) / 'TradeDangerous.db'
+    return Path(str(dbPath))
+
+
+def ensureLoaded(tdb, tdenv):
+    '''
+    Load TD's systems and stations into tdb, once, for the code that needs
+    TD's own objects.
+    '''
+    if not getattr(tdb, 'edapiLoaded', False):
+        tdb.load(maxSystemLinkLy=getattr(tdenv, 'maxSystemLinkLy', None))
+        tdb.edapiLoaded = True
+
+
+def cacheStamp(tdb):
+    '''
+    The size and modification time of the TD database and of every file
+    TD rebuilds it from.
+    '''
+    data = Path(str(tdb.dataPath))
+    paths = sorted(data.glob('*.csv')) + [
+        data / 'TradeDangerous.sql',
+        data / 'TradeDangerous.prices',
+        databasePath(tdb),
+    ]
+    stamp = {}
+    for path in paths:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        stamp[path.name] = [st.st_mtime_ns, st.st_size]
+    return stamp
+
+
+def cacheIsFresh(tdb, path):
+    '''
+    True if nothing changed since saveCacheStamp() wrote path, so TD's
+    cache needs no rebuild.
+    '''
+    try:
+        with open(str(path)) as h:
+            saved = json.load(h)
+    except (OSError, ValueError):
+        return False
+    return saved == cacheStamp(tdb)
+
+
+def saveCacheStamp(tdb, path):
+    '''
+    Note the current cache stamp in path, once every change is written.
+    '''
+    with open(str(path), 'w') as h:
+        json.dump(cacheStamp(tdb), h)
+
+
+def _modified(timestamp):
+    if timestamp is None:
+        return None
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(timestamp))
+
+
+def stationItemRow(stationID, commodity, itemID, modified=None):
+    '''
+    The StationItem row of a Commodity. modified is TD's time text, or None
+    to leave it to the database.
+    '''
+    c = commodity
+
+    # Same as '?' and '-' in a .prices file.
+    demand, demandBracket = c.demand, c.demandBracket
+    if not (demand and demandBracket):
+        demand, demandBracket = -1, -1
+    stock, stockBracket = c.stock, c.stockBracket
+    if not (stock and stockBracket):
+        stock, stockBracket = 0, 0
+
+    return (
+        stationID,
+        itemID,
+        c.sellPrice,
+        demand,
+        demandBracket,
+        c.buyPrice,
+        stock,
+        stockBracket,
+        modified,
+    )
+
+
+def stationItemRows(
+    stationID,
+    market,
+    items,
+    timestamp=None,
+    ignoreUnknown=False
+):
+    '''
+    StationItem rows for a market of Commodity records. items maps upper
+    case names to item IDs, as returned by itemIDs(). Unknown items raise
+    LookupError, or are skipped with ignoreUnknown. A timestamp of None
+    leaves the modified time to the database.
+    '''
+    modified = _modified(timestamp)
+    rows = []
+    for c in market:
+        try:
+            itemID = items[c.name.upper()]
+        except KeyError:
+            if ignoreUnknown:
+                continue
+            raise LookupError('Unknown item: ' + c.name)
+        rows.append(stationItemRow(stationID, c, itemID, modified))
+    return rows
+
+
+# StationItem columns filled from stationItemRow(), and their values.
+_stationItemColumns = (
+    ('station_id', '?'),
+    ('item_id', '?'),
+    ('demand_price', '?'),
+    ('demand_units', '?'),
+    ('demand_level', '?'),
+    ('supply_price', '?'),
+    ('supply_units', '?'),
+    ('supply_level', '?'),
+    ('modified', 'COALESCE(?, CURRENT_TIMESTAMP)'),
+)
+
+
+def replaceStationItems(db, stationIDs, rows):
+    '''
+    Replace the StationItem rows of the given stations with rows, in one
+    transaction.
+    '''
+    # Only newer TD databases tell live prices apart.
+    columns = list(_stationItemColumns)
+    have = {r[1] for r in db.execute('PRAGMA table_info(StationItem)')}
+    if 'from_live' in have:
+        columns.append(('from_live', '0'))
+
+    with db:
+        db.executemany(
+            'DELETE FROM StationItem WHERE station_id = ?',
+            [(stationID,) for stationID in stationIDs],
+        )
+        db.executemany(
+            'INSERT OR REPLACE INTO StationItem ({}) VALUES ({})'.format(
+                ', '.join(name for name, value in columns),
+                ', '.join(value for name, value in columns),
+            ),
+            rows,
+        )
+
+
+def importMarkets(db, markets, ignoreUnknown=False):
+    '''
+    Replace the StationItem rows of every (station ID, market, timestamp)
+    in markets, all in one transaction. Returns the number of rows
+    written.
+    '''
+    items = itemIDs(db)
+    rows = []
+    stationIDs = []
+    for stationID, market, timestamp in markets:
+        stationIDs.append(stationID)
+        rows.extend(stationItemRows(
+            stationID,
+            market,
+            items,
+            timestamp,
+            ignoreUnknown,
+        ))
+
+    replaceStationItems(db, stationIDs, rows)
+    return len(rows)
+
+
+def syncShipVendor(db, stationID, shipIDs):
+    '''
+    Make the ShipVendor rows of a station match shipIDs, adding and
+    deleting only the ships that changed, in one transaction. Returns the
+    sets of ship IDs added and removed.
+    '''
+    current = {
+        shipID
+        for shipID, in db.execute(
+            'SELECT ship_id FROM ShipVendor WHERE station_id = ?',
+            (stationID,),
+        )
+    }
+    wanted = set(shipIDs)
+    added = wanted - current
+    removed = current - wanted
+
+    if added or removed:
+        with db:
+            db.executemany(
+                'DELETE FROM ShipVendor WHERE ship_id = ? AND station_id = ?',
+                [(shipID, stationID) for shipID in sorted(removed)],
+            )
+            db.executemany(
+                'INSERT INTO ShipVendor (ship_id, station_id) VALUES (?, ?)',
+                [(shipID, stationID) for shipID in sorted(added)],
+            )
+
+    return added, removed
+
+
+class StationItemSink(Sink):
+    '''
+    A pipeline sink writing every market to the StationItem table in one
+    transaction when closed. Places need their station IDs.
+    '''
+
+    def __init__(self, tdb, tdenv, ignoreUnknown=False):
+        '''
+        Initialize
+        '''
+        self.tdb = tdb
+        self.tdenv = tdenv
+        self.ignoreUnknown = ignoreUnknown
+        self.db = tdb.getDB()
+        self.items = itemIDs(self.db)
+        self.stationIDs = []
+        self.rows = []
+        self._stationID = self._modified = None
+
+    def start(self, place):
+        self._stationID = place.stationID
+        self._modified = _modified(place.timestamp)
+        self.stationIDs.append(place.stationID)
+
+    def add(self, commodity):
+        try:
+            itemID = self.items[commodity.name.upper()]
+        except KeyError:
+            if self.ignoreUnknown:
+                return
+            raise LookupError('Unknown item: ' + commodity.name)
+        self.rows.append(stationItemRow(
+            self._stationID,
+            commodity,
+            itemID,
+            self._modified,
+        ))
+
+    def close(self):
+        if not self.stationIDs:
+            return
+        replaceStationItems(self.db, self.stationIDs, self.rows)
+        self.tdenv.NOTE(
+            "Imported {} prices for {} stations.",
+            len(self.rows),
+            len(self.stationIDs),
+        )
+        regeneratePrices(self.tdb, self.tdenv)
+
+
+class PricesTextSink(Sink):
+    '''
+    A pipeline sink writing every market to one in-memory .prices file,
+    with each category header once and items in TD order, which TD
+    imports when the sink is closed.
+    '''
+
+    def __init__(self, tdb, tdenv):
+        '''
+        Initialize
+        '''
+        self.tdb = tdb
+        self.tdenv = tdenv
+        self.order = itemOrder(tdb.getDB())
+        self.f = io.StringIO()
+        self.count = 0
+        self._current = None
+
+    def start(self, place):
+        self._current = []
+
+    def add(self, commodity):
+        self._current.append(commodity)
+
+    def finish(self, place):
+        suffix = ''
+        if place.timestamp is not None:
+            suffix = ' ' + _modified(place.timestamp)
+
+        f = self.f
+        f.write("@ {}/{}\n".format(place.system, place.station))
+        for category, lines in groupLines(self._current, suffix, self.order):
+            f.write("\t+ {}\n".format(category))
+            f.writelines(lines)
+        self.count += 1
+        self._current = None
+
+    def close(self):
+        if not self.count:
+            return
+        import cache
+
+        # Ask TD to parse the prices from an in-memory file. TD likes to
+        # use Path objects.
+        with memoryFile(self.f.getvalue().encode('UTF-8')) as fpath:
+            cache.importDataFromFile(self.tdb, self.tdenv, fpath)
+
+
+def regeneratePrices(tdb, tdenv):
+    '''
+    Rewrite TD's own TradeDangerous.prices from the database, as its
+    importer does, when this version of TD has the function for it.
+    '''
+    import cache
+
+    regenerate = getattr(cache, 'regeneratePricesFile', None)
+    if regenerate is not None:
+        regenerate(tdb, tdenv)
+
+
+@contextlib.contextmanager
+def memoryFile(data, name='edapi.prices'):
+    '''
+    Yield the Path of a file holding data, for code that wants a file name.
+    On Linux the file is an anonymous memfd reached through /proc, so
+    nothing touches the disk. Elsewhere it is a temporary file, removed
+    afterwards.
+    '''
+    if hasattr(os, 'memfd_create') and os.path.isdir('/proc/self/fd'):
+        fd = os.memfd_create(name, os.MFD_CLOEXEC)
+        try:
+            with open(fd, 'wb', closefd=False) as h:
+                h.write(data)
+            yield Path('/proc/self/fd/{}'.format(fd))
+        finally:
+            os.close(fd)
+        return
+
+    f = tempfile.NamedTemporaryFile(suffix='.prices', delete=False)
+    try:
+        with f:
+            f.write(data)
+        yield Path(f.name)
+    finally:
+        os.unlink(f.name)
@@ -0,0 +1,400 @@
+# ----------------------------------------------------------------
+# HTTP transport shared by the EDAPI command line tool and the
+# Trade Dangerous plugin. Keeps a pooled keep-alive session and
+# retries transient failures.
+# ----------------------------------------------------------------
+
+import requests
+from requests.adapters import HTTPAdapter
+import socket
+import threading
+import time
+from urllib3 import connection
+from urllib3 import connectionpool
+from urllib3.util import connection as connectionUtil
+
+
+class TransportConfig:
+    '''
+    Tunables for the companion API transport.
+    '''
+
+    # Connection pool.
+    poolConnections = 4
+    poolMaxsize = 8
+
+    # Timeouts in seconds.
+    connectTimeout = 10.0
+    readTimeout = 30.0
+
+    # Retry policy. Only idempotent methods are retried on a bad status
+    # or a failure after the request was sent.
+    retries = 3
+    backoff = 0.5
+    backoffMax = 8.0
+    retryStatus = (500, 502, 503, 504)
+    retryMethods = ('GET', 'HEAD')
+
+    def __init__(self, **kwargs):
+        for key, value in kwargs.items():
+            if not hasattr(TransportConfig, key):
+                raise TypeError('Unknown transport option: ' + key)
+            if value is not None:
+                setattr(self, key, value)
+
+    @property
+    def timeout(self):
+        return (self.connectTimeout, self.readTimeout)
+
+    def delay(self, attempt):
+        '''
+        Backoff delay before retry number attempt (1 based).
+        '''
+        return min(self.backoffMax, self.backoff * (2 ** (attempt - 1)))
+
+
+# What a companion API response says about our session.
+AUTH_OK = 'ok'
+AUTH_LOGIN = 'login'
+AUTH_CONFIRM = 'confirm'
+
+# How much of an HTML body authState() will look through.
+AUTH_SNIFF_BYTES = 65536
+
+
+def _authPath(url):
+    url = str(url).split('?', 1)[0]
+    if url.endswith('user/login'):
+        return AUTH_LOGIN
+    if url.endswith('user/confirm'):
+        return AUTH_CONFIRM
+    return None
+
+
+def authState(response):
+    '''
+    Classify a companion API response as AUTH_OK, AUTH_LOGIN (the session
+    is not logged in) or AUTH_CONFIRM (a verification code is wanted).
+
+    Decided from the status code, the final URL, the redirect history and
+    the content type. Only an HTML body that gave nothing else away is
+    searched, and then only its first AUTH_SNIFF_BYTES undecoded bytes.
+    '''
+    state = _authPath(response.url)
+    if state:
+        return state
+
+    for hop in response.history:
+        state = _authPath(hop.headers.get('Location', ''))
+        if state:
+            return state
+
+    if response.status_code in (401, 403):
+        return AUTH_LOGIN
+
+    contentType = response.headers.get('Content-Type', '').lower()
+    if 'json' in contentType:
+        return AUTH_OK
+
+    if not contentType or 'html' in contentType:
+        if b'Password' in response.content[:AUTH_SNIFF_BYTES]:
+            return AUTH_LOGIN
+
+    return AUTH_OK
+
+
+# Connection set up times of the request running in this thread.
+_timings = threading.local()
+
+# urllib3's own connect, wrapped by _timedCreateConnection().
+_createConnection = connectionUtil.create_connection
+
+
+def _timedCreateConnection(address, *args, **kwargs):
+    '''
+    urllib3's create_connection() with its name resolution timed, for
+    connections opened by a _TimedConnection. The host is resolved once,
+    here, and each address is handed on numerically so urllib3 doesn't
+    resolve it again.
+    '''
+    if not getattr(_timings, 'active', False):
+        return _createConnection(address, *args, **kwargs)
+
+    host, port = address
+    start = time.perf_counter()
+    try:
+        addresses = socket.getaddrinfo(
+            host.strip('[]'),
+            port,
+            connectionUtil.allowed_gai_family(),
+            socket.SOCK_STREAM,
+        )
+    finally:
+        _timings.dns = time.perf_counter() - start
+
+    error = OSError('getaddrinfo returned no addresses')
+    for family, socktype, proto, canonname, sockaddr in addresses:
+        try:
+            return _createConnection(sockaddr[:2], *args, **kwargs)
+        except OSError as e:
+            error = e
+    raise error
+
+
+connectionUtil.create_connection = _timedCreateConnection
+
+
+class _TimedConnection:
+    '''
+    Records how long name resolution and connecting (including the TLS
+    handshake) take for new connections. Reused connections record
+    nothing.
+    '''
+
+    def connect(self):
+        _timings.active = True
+        _timings.dns = None
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _timings.active = False
+            elapsed = time.perf_counter() - start
+            _timings.connect = elapsed - (_timings.dns or 0)
+
+
+class TimedHTTPConnection(_TimedConnection, connection.HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnection, connection.HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(connectionpool.HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(connectionpool.HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimingAdapter(HTTPAdapter):
+    '''
+    An HTTPAdapter whose connections record their set up times.
+    '''
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
+
+
+class Attempt:
+    '''
+    The outcome of one HTTP attempt. Times are in seconds; dns and connect
+    are None when a kept-alive connection was reused.
+    '''
+
+    __slots__ = (
+        'method',
+        'url',
+        'label',
+        'attempt',
+        'status',
+        'elapsed',
+        'error',
+        'dns',
+        'connect',
+        'ttfb',
+        'bytes',
+    )
+
+    def __init__(
+        self,
+        method,
+        url,
+        attempt,
+        status,
+        elapsed,
+        error=None,
+        label=None,
+        dns=None,
+        connect=None,
+        ttfb=None,
+        bytes=0
+    ):
+        self.method = method
+        self.url = url
+        self.label = url if label is None else label
+        self.attempt = attempt
+        self.status = status
+        self.elapsed = elapsed
+        self.error = error
+        self.dns = dns
+        self.connect = connect
+        self.ttfb = ttfb
+        self.bytes = bytes
+
+    def __str__(self):
+        return '{} {} #{}: {} in {:.3f}s'.format(
+            self.method,
+            self.url,
+            self.attempt,
+            self.error or self.status,
+            self.elapsed,
+        )
+
+
+def _notSent(error):
+    '''
+    True if a request failed before anything was sent, because connecting
+    timed out or was refused.
+    '''
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    seen = set()
+    pending = [error]
+    while pending:
+        e = pending.pop()
+        if e is None or id(e) in seen:
+            continue
+        seen.add(id(e))
+        if isinstance(e, ConnectionRefusedError):
+            return True
+        pending.append(e.__cause__)
+        pending.append(e.__context__)
+        pending.append(getattr(e, 'reason', None))
+        pending.extend(a for a in e.args if isinstance(a, BaseException))
+    return False
+
+
+class Transport:
+    '''
+    A pooled, keep-alive HTTP session with timeouts and bounded retries.
+    '''
+
+    def __init__(self, agent, config=None, debug=False, stats=None):
+        '''
+        Initialize
+
+        Each attempt is handed to stats.add(), if stats is given, and
+        printed in debug mode. The transport keeps none of them.
+        '''
+        self.config = config or TransportConfig()
+        self.debug = debug
+        self.stats = stats
+
+        self.session = requests.Session()
+        self.session.headers = {
+            'User-Agent': agent,
+            'Connection': 'keep-alive',
+        }
+
+        # We handle retries ourselves so each attempt can be timed.
+        adapter = TimingAdapter(
+            pool_connections=self.config.poolConnections,
+            pool_maxsize=self.config.poolMaxsize,
+            max_retries=0,
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @property
+    def cookies(self):
+        return self.session.cookies
+
+    @cookies.setter
+    def cookies(self, jar):
+        self.session.cookies = jar
+
+    def request(self, method, url, data=None, label=None):
+        '''
+        Perform a request, retrying transient failures. The label names
+        the request in the recorded attempts and defaults to the URL.
+        '''
+        config = self.config
+        attempt = 0
+        while True:
+            attempt += 1
+            _timings.dns = _timings.connect = None
+            start = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method,
+                    url,
+                    data=data,
+                    timeout=config.timeout,
+                )
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ) as e:
+                self._record(
+                    method, url, label, attempt, None, start,
+                    error=type(e).__name__
+                )
+                # The server may have seen a POST that failed after it was
+                # sent, so only retry one that never got a connection.
+                if method not in config.retryMethods and not _notSent(e):
+                    raise
+                if attempt > config.retries:
+                    raise
+            else:
+                self._record(
+                    method, url, label, attempt, response.status_code, start,
+                    response=response
+                )
+                if (
+                    response.status_code not in config.retryStatus or
+                    method not in config.retryMethods or
+                    attempt > config.retries
+                ):
+                    return response
+                response.close()
+
+            time.sleep(config.delay(attempt))
+
+    def get(self, url, label=None):
+        return self.request('GET', url, label=label)
+
+    def post(self, url, data, label=None):
+        return self.request('POST', url, data=data, label=label)
+
+    def close(self):
+        self.session.close()
+
+    def _record(
+        self,
+        method,
+        url,
+        label,
+        attempt,
+        status,
+        start,
+        error=None,
+        response=None
+    ):
+        # The body has already been read, so this is the whole request.
+        elapsed = time.perf_counter() - start
+        result = Attempt(
+            method,
+            url,
+            attempt,
+            status,
+            elapsed,
+            error=error,
+            label=label,
+            dns=_timings.dns,
+            connect=_timings.connect,
+        )
+        if response is not None:
+            result.ttfb = response.elapsed.total_seconds()
+            result.bytes = len(response.content)
+        if self.stats is not None:
+            self.stats.add(result)
+        if self.debug:
+            print('Attempt:', result)
+        return result